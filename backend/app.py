@@ -1,7 +1,22 @@
-from flask import Flask, jsonify, request, session as flask_session
+from flask import Flask, jsonify, request
 from auth.login import auth as auth_bp, limiter
+from auth.availability import init_availability
+from auth.identity import current_user_id
+from auth.monitoring import require_stats_token
+from auth.pending_sweeper import init_pending_sweeper
 from products.products import products_bp
-from models import db, Message, User
+from products.search import init_product_search
+from products.cache import init_product_cache
+from products.images import init_image_pipeline
+from products.storage import UploadRequest
+from conversations import init_conversations
+from email_outbox import init_email_outbox
+from delivery import acknowledge, get_watermark, recent_messages, sync_payload
+from message_writer import MessageWriter, MessageWriterBusy
+from socket_bus import socketio_bus_options
+from usernames import message_payloads, resolve_user_id
+from database import configure_database
+from models import db, create_missing_columns, create_missing_indexes
 from flask_socketio import SocketIO, emit, join_room
 import logging
 import os
@@ -13,12 +28,14 @@ load_dotenv()
 
 app = Flask(__name__)
 
-# Database configuration
-# Ensure instance folder exists and use a stable absolute DB path
-os.makedirs(app.instance_path, exist_ok=True)
-db_file = os.path.abspath(os.path.join(app.instance_path, "users.db"))
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_file}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Stream file uploads to disk with incremental hashing and early size/type checks
+app.request_class = UploadRequest
+app.config['MAX_IMAGE_UPLOAD_BYTES'] = int(os.environ.get("MAX_IMAGE_UPLOAD_BYTES", 10 * 1024 * 1024))
+# Whole request body (image + form fields); larger requests get 413 before being read
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_CONTENT_LENGTH", 12 * 1024 * 1024))
+
+# Database configuration (DATABASE_URL, pool and SQLite tuning - see database.py)
+configure_database(app)
 
 
 # Initialize database
@@ -39,6 +56,28 @@ app.register_blueprint(products_bp, url_prefix="/products")
 # Create database tables if they don't exist
 with app.app_context():
     db.create_all()
+    create_missing_columns()
+    create_missing_indexes()
+    # Full-text search index for products (kept in sync by triggers)
+    init_product_search(app)
+
+# In-memory index of taken usernames/emails for /auth/check and register
+init_availability(app)
+
+# Inbox summaries (maintained on every message insert; backfilled once)
+init_conversations(app)
+
+# Response cache for the read-only product endpoints
+init_product_cache(app)
+
+# Worker pool that renders resized variants of uploaded product photos
+init_image_pipeline(app)
+
+# Background sender for queued emails (verification codes)
+init_email_outbox(app)
+
+# Periodic cleanup of expired, never-verified sign-ups
+init_pending_sweeper(app)
 
 
 # Secret key for session management
@@ -71,6 +110,13 @@ def add_cors_headers(response):
     return response
 
 
+# Upload limits are enforced while the body is parsed; answer in the API's JSON error format
+@app.errorhandler(413)
+@app.errorhandler(415)
+def upload_rejected(error):
+    return jsonify({"error": error.description}), error.code
+
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -89,39 +135,74 @@ app,
     manage_session=False,
     async_mode="gevent",
     logger=True,
-    engineio_logger=False
+    engineio_logger=False,
+    # SOCKETIO_MESSAGE_QUEUE: share emits/rooms between several workers (see socket_bus.py)
+    **socketio_bus_options()
+)
+
+# Chat messages sent over the socket are persisted in group commits:
+# MESSAGE_BATCH_MAX messages or MESSAGE_BATCH_DELAY_MS of waiting, whichever comes first;
+# beyond MESSAGE_QUEUE_MAX waiting messages new ones are turned away
+message_writer = MessageWriter(
+    socketio,
+    app,
+    max_batch=int(os.environ.get("MESSAGE_BATCH_MAX", 100)),
+    max_delay=float(os.environ.get("MESSAGE_BATCH_DELAY_MS", 5)) / 1000,
+    max_queued=int(os.environ.get("MESSAGE_QUEUE_MAX", 10000)),
 )
 
 # Socket.IO event handlers (place these before the run call)
 @socketio.on("connect")
-def handle_connect():
-    user_id = flask_session.get("user_id")
+def handle_connect(auth=None):
+    user_id = current_user_id()
     if user_id:
         join_room(f"user_{user_id}")
 
-        # Send recent messages involving this user (helps deliver missed messages)
-        recent = (
-            Message.query
-            .filter((Message.recipient_id == user_id) | (Message.sender_id == user_id))
-            .order_by(Message.created_at.desc())
-            .limit(50)
-            .all()
-        )
-        # build recent_payload with usernames
-        recent_payload = []
-        for m in reversed(recent):
-            d = m.to_dict()
-            s = User.query.get(m.sender_id)
-            r = User.query.get(m.recipient_id)
-            d["sender_username"] = s.username if s else None
-            d["recipient_username"] = r.username if r else None
-            recent_payload.append(d)
-
-        if recent_payload:
-            socketio.emit("message_history", {"messages": recent_payload}, room=f"user_{user_id}")
+        # Where this client left off: its own last-seen id, else its acknowledged watermark
+        last_seen_id = _int_or_none((auth or {}).get("last_seen_id"))
+        if last_seen_id is None:
+            last_seen_id = get_watermark(user_id)
+
+        if last_seen_id is not None:
+            # Send only what was missed, to this connection (nothing at all if up to date)
+            payload = sync_payload(user_id, last_seen_id)
+            if payload:
+                emit("missed_messages", payload)
+        else:
+            # Client that has never synced: send recent messages involving this user
+            recent = recent_messages(user_id)
+            # build recent_payload with usernames (one batched lookup for all senders/recipients)
+            recent_payload = message_payloads(recent)
+
+            if recent_payload:
+                socketio.emit("message_history", {"messages": recent_payload}, room=f"user_{user_id}")
 
     emit("connected", {"msg": "connected"})
 
+def _int_or_none(val):
+    try:
+        return int(val)
+    except (ValueError, TypeError):
+        return None
+
+@socketio.on("sync")
+def handle_sync(data):
+    # next page of missed messages: { after_id }
+    user_id = current_user_id()
+    after_id = _int_or_none((data or {}).get("after_id"))
+    if not user_id or after_id is None:
+        return
+    emit("missed_messages", sync_payload(user_id, after_id) or {"messages": [], "has_more": False, "after_id": after_id})
+
+@socketio.on("ack")
+def handle_ack(data):
+    # client has received everything up to { up_to_id }
+    user_id = current_user_id()
+    up_to_id = _int_or_none((data or {}).get("up_to_id"))
+    if not user_id or up_to_id is None:
+        return
+    acknowledge(user_id, up_to_id)
+
 @socketio.on("join")
 def handle_join(data):
     # client can explicitly join a room (e.g. { "user_id": 2 } or username)
@@ -130,69 +211,46 @@ def handle_join(data):
         return
 
     # normalize to integer id (allow passing username or id)
-    try:
-        uid = int(raw)
-    except (ValueError, TypeError):
-        u = User.query.filter_by(username=raw).first()
-        if not u:
-            return
-        uid = u.id
+    uid = resolve_user_id(raw)
+    if not uid:
+        return
 
     join_room(f"user_{uid}")
 
-def _resolve_user_raw(val):
-    # accepts an int-like value or a username; returns numeric id or None
-    if val is None:
-        return None
-    try:
-        return int(val)
-    except (ValueError, TypeError):
-        u = User.query.filter_by(username=val).first()
-        return u.id if u else None
-
 @socketio.on("send_message")
 def handle_send_message(data):
     # data: { sender_id (id or username), recipient_id (id or username), body, client_id? }
     raw_sender = data.get("sender_id")
     raw_recipient = data.get("recipient_id")
-    sender = _resolve_user_raw(raw_sender) or flask_session.get("user_id")
-    recipient = _resolve_user_raw(raw_recipient)
+    sender = resolve_user_id(raw_sender) or current_user_id()
+    recipient = resolve_user_id(raw_recipient)
     body = (data.get("body") or "").strip()
     if not sender or not recipient or not body:
         return
 
-    # persist message
-    msg = Message(sender_id=sender, recipient_id=recipient, body=body)
-    db.session.add(msg)
-    db.session.commit()
-    out = msg.to_dict()
-
-    # add readable usernames so clients can detect "mine" reliably
-    sender_user = User.query.get(sender)
-    recipient_user = User.query.get(recipient)
-    out["sender_username"] = sender_user.username if sender_user else None
-    out["recipient_username"] = recipient_user.username if recipient_user else None
-
-    # echo back client_id if provided so client can reconcile optimistic message
-    client_id = data.get("client_id")
-    if client_id:
-        out["client_id"] = client_id
-
-    # emit new_message to recipient and sender rooms
-    socketio.emit("new_message", out, room=f"user_{recipient}")
-    socketio.emit("new_message", out, room=f"user_{sender}")
-
-    logger.info(
-        "Persisted message %s from %s to %s — emitting to rooms %s and %s",
-        out.get("id"),
-        sender,
-        recipient,
-        f"user_{recipient}",
-        f"user_{sender}"
-    )
+    # queue for the next group commit; new_message is emitted to the sender's
+    # and recipient's rooms once the batch is durable (see message_writer.py)
+    try:
+        message_writer.submit(sender, recipient, body, client_id=data.get("client_id"))
+    except MessageWriterBusy:
+        # writer is backed up - tell the sender so the message can be retried
+        emit("message_error", {
+            "error": "server busy, please try again",
+            "body": body,
+            "client_id": data.get("client_id"),
+        })
+
+
+@app.route("/api/messages/writer/stats", methods=["GET"])
+def message_writer_stats():
+    error = require_stats_token()
+    if error:
+        return error
+    return jsonify(message_writer.stats())
 
 
 if __name__ == "__main__":
     # Ensure eventlet is installed (server async worker for websockets)
     # Start the Socket.IO server here (top-level)
-    socketio.run(app, debug=True, port=5001)
\ No newline at end of file
+    # PORT lets several workers run side by side behind a load balancer
+    socketio.run(app, debug=True, port=int(os.environ.get("PORT", 5001)))
\ No newline at end of file
@@ -0,0 +1,159 @@
+# backend/auth/availability.py
+"""
+In-memory index of taken usernames and emails
+
+The registration form calls POST /auth/check on every keystroke, and each
+call used to run a User lookup for the username and another for the email;
+/auth/register repeated both. Almost every name typed is available, so
+almost all of those queries come back empty.
+
+AvailabilityIndex keeps the (lowercased) usernames and emails of all users in
+two hash sets per process:
+
+- a value that is not in the set is definitely available - answered from
+  memory, no query
+- a value that is in the set is probably taken; one indexed query confirms
+  it (the sets compare case-insensitively while usernames are
+  case-sensitive, and deleted users are never removed from the sets)
+
+The sets are warmed at startup, extended by a mapper event whenever this
+process inserts or updates a User, and caught up with users created by
+other processes by loading rows with an id above the highest one seen - at
+most every AVAILABILITY_REFRESH_SECONDS, or before every check in register.
+A name taken by another worker within that window can still look available
+to /auth/check; the unique constraints on User remain the final word when the
+account is created (verify_email answers 409).
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event, or_
+
+from models import db, User
+
+REFRESH_SECONDS = float(os.environ.get("AVAILABILITY_REFRESH_SECONDS", 2))
+WARM_BATCH_SIZE = 10000
+
+
+def normalize(value):
+    return (value or "").strip().lower()
+
+
+class AvailabilityIndex:
+    def __init__(self, refresh_seconds=REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._usernames = set()
+        self._emails = set()
+        # Highest User.id loaded from the database; rows above it are new
+        self._max_id = 0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self.memory_answers = 0
+        self.db_checks = 0
+
+    def add(self, username, email):
+        # set.add is atomic under the GIL; no lock needed for readers
+        if username:
+            self._usernames.add(normalize(username))
+        if email:
+            self._emails.add(normalize(email))
+
+    def refresh(self, max_age=None):
+        """Load users created since the last refresh if it is older than max_age seconds"""
+        max_age = self.refresh_seconds if max_age is None else max_age
+        if time.monotonic() - self._refreshed_at < max_age:
+            return 0
+        with self._lock:
+            if time.monotonic() - self._refreshed_at < max_age:
+                return 0  # another thread just did it
+            loaded = 0
+            while True:
+                rows = (
+                    db.session.query(User.id, User.username, User.email)
+                    .filter(User.id > self._max_id)
+                    .order_by(User.id)
+                    .limit(WARM_BATCH_SIZE)
+                    .all()
+                )
+                for user_id, username, email in rows:
+                    self.add(username, email)
+                if rows:
+                    self._max_id = rows[-1][0]
+                loaded += len(rows)
+                if len(rows) < WARM_BATCH_SIZE:
+                    break
+            self._refreshed_at = time.monotonic()
+            return loaded
+
+    def might_contain_username(self, username):
+        return normalize(username) in self._usernames
+
+    def might_contain_email(self, email):
+        return normalize(email) in self._emails
+
+    def taken(self, username=None, email=None):
+        """
+        Which of the given username / email belong to an existing user
+
+        Returns {"username": bool, "email": bool} for the values passed.
+        Values not in the index are reported free without a query; possible
+        hits are confirmed together with a single query.
+        """
+        result = {}
+        candidates = []
+        if username:
+            result["username"] = False
+            if self.might_contain_username(username):
+                candidates.append(User.username == username)
+        if email:
+            result["email"] = False
+            if self.might_contain_email(email):
+                candidates.append(User.email == email)
+
+        if not candidates:
+            self.memory_answers += 1
+            return result
+
+        self.db_checks += 1
+        for found_username, found_email in (
+            db.session.query(User.username, User.email).filter(or_(*candidates)).all()
+        ):
+            if username and found_username == username:
+                result["username"] = True
+            if email and found_email == email:
+                result["email"] = True
+        return result
+
+    def stats(self):
+        return {
+            "usernames": len(self._usernames),
+            "emails": len(self._emails),
+            "max_user_id": self._max_id,
+            "answered_from_memory": self.memory_answers,
+            "confirmed_with_query": self.db_checks,
+        }
+
+
+availability_index = AvailabilityIndex()
+
+
+def init_availability(app):
+    """Warm the index with every existing user (call once at startup)"""
+    with app.app_context():
+        availability_index.refresh(max_age=0)
+    return availability_index
+
+
+def check_taken(username=None, email=None, max_age=None):
+    """availability_index.taken(), after catching up with users created elsewhere"""
+    availability_index.refresh(max_age)
+    return availability_index.taken(username, email)
+
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def _index_user(mapper, connection, target):
+    # Added even if the transaction later rolls back: an extra entry only
+    # costs one confirming query, a missing one would report a taken name free
+    availability_index.add(target.username, target.email)
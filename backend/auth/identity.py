@@ -0,0 +1,96 @@
+# backend/auth/identity.py
+"""
+Who is the current user - without a query on every request
+
+The session cookie only holds a user id. /auth/me, /auth/logout, the product
+ownership checks and the Socket.IO handlers each turned that id into a user
+on their own, and the React app calls /auth/me on almost every page
+transition, so an ordinary authenticated page load paid at least one User
+lookup just to learn who is asking.
+
+current_user() resolves the session's user once per request (kept on
+flask.g) and caches the result per process for IDENTITY_CACHE_TTL_SECONDS,
+so repeated requests from the same user skip the database entirely. The
+cached identity is a plain dict {"id", "username", "email"} - not a User
+object, which would be detached from the session on the next request;
+callers must not modify it.
+
+Entries are dropped on logout and whenever this process updates or deletes
+the User (see caches.on_user_changed); changes made by other processes show
+up once the TTL runs out. Unknown ids (deleted accounts with a leftover
+cookie) are cached too, as None.
+"""
+import os
+
+from flask import g, has_app_context, session
+
+from caches import LRUCache, on_user_changed
+from models import db, User
+
+IDENTITY_CACHE_TTL_SECONDS = float(os.environ.get("IDENTITY_CACHE_TTL_SECONDS", 30))
+IDENTITY_CACHE_SIZE = 10000
+
+_MISSING = object()
+
+
+# user id -> identity dict, or None for ids with no user
+identity_cache = LRUCache(IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL_SECONDS)
+
+
+def identity_of(user):
+    return {"id": user.id, "username": user.username, "email": user.email}
+
+
+def load_identity(user_id):
+    """Identity dict for a user id (cached), or None if there is no such user"""
+    identity = identity_cache.get(user_id, _MISSING)
+    if identity is _MISSING:
+        user = db.session.get(User, user_id)
+        identity = identity_of(user) if user else None
+        identity_cache.set(user_id, identity)
+    return identity
+
+
+def remember_user(user):
+    """Prime the cache right after login, when the User is already loaded"""
+    identity_cache.set(user.id, identity_of(user))
+    if has_app_context():
+        # the session changed hands within this request
+        g.pop("current_identity", None)
+
+
+def current_user():
+    """
+    Identity dict of the logged-in user, or None
+
+    Works in HTTP requests and Socket.IO handlers (both have the session);
+    resolved at most once per request or event.
+    """
+    if has_app_context() and "current_identity" in g:
+        return g.current_identity
+    user_id = session.get("user_id")
+    identity = load_identity(user_id) if user_id else None
+    if has_app_context():
+        g.current_identity = identity
+    return identity
+
+
+def current_user_id():
+    identity = current_user()
+    return identity["id"] if identity else None
+
+
+def forget_current_user():
+    """Drop the current user from the caches (call on logout)"""
+    user_id = session.get("user_id")
+    if user_id:
+        identity_cache.forget(user_id)
+    if has_app_context():
+        g.pop("current_identity", None)
+
+
+@on_user_changed
+def _forget_identity(user_id):
+    identity_cache.forget(user_id)
+    if has_app_context():
+        g.pop("current_identity", None)
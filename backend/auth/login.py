@@ -1,11 +1,18 @@
 from flask import Blueprint, request, jsonify, session
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from werkzeug.security import check_password_hash, generate_password_hash
+from auth.availability import check_taken
+from auth.identity import current_user, forget_current_user, remember_user
+from auth.monitoring import require_stats_token
+from auth.passwords import PasswordHasherBusy, hash_password, needs_rehash, verify_password
+from auth.pending_sweeper import sweeper_stats
 from models import db, User, PendingVerification
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
-from email_service import send_verification_email
+from email_outbox import enqueue_verification_email, notify_outbox
+# importing it registers the "sqlite" storage scheme with Flask-Limiter
+from auth import ratelimit_storage
+import os
 import re
 import random
 import logging
@@ -16,7 +23,23 @@ auth = Blueprint("auth", __name__)
 logger = logging.getLogger(__name__)
 
 # initialize rate limiter (prevent spam and brute force)
-limiter = Limiter(key_func=get_remote_address, storage_uri="memory://", default_limits=["200 per day", "50 per hour"])
+# Counters are kept in a SQLite file shared by all worker processes (see
+# auth/ratelimit_storage.py); RATELIMIT_STORAGE_URI=memory:// keeps them per process.
+# If the storage is unavailable, limits fall back to in-memory counters.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.environ.get("RATELIMIT_STORAGE_URI", ratelimit_storage.DEFAULT_STORAGE_URI),
+    strategy=os.environ.get("RATELIMIT_STRATEGY", "sliding-window-counter"),
+    in_memory_fallback_enabled=True,
+    default_limits=["200 per day", "50 per hour"],
+)
+
+
+def _hasher_busy():
+    # Password hashing queue is full - ask the client to retry shortly
+    response = jsonify({"error": "server busy, please try again"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 
 def generate_verification_code():
@@ -43,7 +66,7 @@ def register():
     2. Check if username/email are already taken
     3. Generate a 4-digit verification code
     4. Store all data in PendingVerification table temporarily
-    5. Send verification code to user's email
+    5. Queue the verification email (sent in the background by email_outbox.py)
     6. Return status and tell user to check their email
     
     Only after the user verifies their email (via /verify-email endpoint)
@@ -83,14 +106,21 @@ def register():
 
     # Check if username or email already exists in User table
     # (they might also be in PendingVerification, but we'll replace that)
-    if User.query.filter_by(username=username).first():
+    # Answered from the in-memory index unless one of them may be taken;
+    # max_age=0 first picks up users created by other workers
+    taken = check_taken(username=username, email=email, max_age=0)
+    if taken["username"]:
         return jsonify({"error": "username already taken"}), 409
-    if User.query.filter_by(email=email).first():
+    if taken["email"]:
         return jsonify({"error": "email already registered"}), 409
 
     # Generate 4-digit verification code and hash password
     code = generate_verification_code()
-    password_hash = generate_password_hash(password)
+    # Hashed in a thread pool so the event loop (and live chat) isn't blocked
+    try:
+        password_hash = hash_password(password)
+    except PasswordHasherBusy:
+        return _hasher_busy()
     
     # Calculate expiration time (10 minutes from now)
     expires_at = datetime.utcnow() + timedelta(minutes=10)
@@ -116,21 +146,18 @@ def register():
     
     try:
         db.session.add(pending)
+        # Queue the verification email in the same transaction; the outbox
+        # worker sends it (with retries) so this request doesn't wait on Brevo
+        enqueue_verification_email(email, code)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error creating pending verification: {e}")
         return jsonify({"error": "failed to process registration"}), 500
-    
-    # Send verification code via email
-    # If email service fails, we've still stored the data, user can try again
-    email_sent = send_verification_email(email, code)
-    if not email_sent:
-        logger.warning(f"Failed to send verification email to {email}, but pending verification created")
-        return jsonify({"error": "failed to send verification email"}), 500
+    notify_outbox()
     
     # Success: tell frontend to show verification code input page
-    logger.info(f"Registration initiated for {email}, verification code sent")
+    logger.info(f"Registration initiated for {email}, verification email queued")
     return jsonify({
         "ok": True,
         "msg": "verification code sent to email",
@@ -234,6 +261,7 @@ def verify_email():
         session.clear()
         session['user_id'] = new_user.id
         session.permanent = True
+        remember_user(new_user)
         
         logger.info(f"User {new_user.username} created and logged in after email verification")
         
@@ -271,7 +299,7 @@ def resend_code():
     3. Generates a NEW 4-digit code
     4. Resets the expiration timer (another 10 minutes)
     5. Resets the attempt counter (fresh start for guessing)
-    6. Sends the new code via email
+    6. Queues the new code for the email outbox
     
     Request JSON:
         {
@@ -305,18 +333,16 @@ def resend_code():
     pending.attempts = 0  # Reset failed attempts counter
     
     try:
+        # Queue the new code for the outbox worker, atomically with the update
+        enqueue_verification_email(email, new_code)
         db.session.commit()
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error updating pending verification: {e}")
         return jsonify({"error": "failed to resend code"}), 500
+    notify_outbox()
     
-    # Send the new code via email
-    email_sent = send_verification_email(email, new_code)
-    if not email_sent:
-        return jsonify({"error": "failed to send verification email"}), 500
-    
-    logger.info(f"Resent verification code to {email}")
+    logger.info(f"Queued new verification code for {email}")
     return jsonify({
         "ok": True,
         "msg": "new verification code sent"
@@ -366,14 +392,31 @@ def login():
     user = User.query.filter_by(username=username).first()
     
     # Verify user exists and password is correct using secure hash comparison
-    if not user or not check_password_hash(user.password_hash, password):
+    try:
+        password_ok = user is not None and verify_password(user.password_hash, password)
+    except PasswordHasherBusy:
+        return _hasher_busy()
+    if not password_ok:
         return jsonify({"error": "invalid credentials"}), 401
+
+    # Upgrade hashes made with older/weaker parameters while we have the password
+    if needs_rehash(user.password_hash):
+        try:
+            user.password_hash = hash_password(password)
+            db.session.commit()
+            logger.info(f"Rehashed password for {username}")
+        except PasswordHasherBusy:
+            pass  # try again on a later login
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to rehash password for {username}: {e}")
     
     # Log the user in by setting a session cookie
     # The session persists across requests until logout
     session.clear()
     session['user_id'] = user.id
     session.permanent = True
+    remember_user(user)  # so the /auth/me that follows needs no query
 
     logger.info(f"User {username} logged in")
     return jsonify({"ok": True, "msg": "login successful"}), 200
@@ -394,13 +437,10 @@ def logout():
             "msg": "logout successful"
         }
     """
-    username = None
-    user_id = session.get("user_id")
-    if user_id:
-        user = User.query.get(user_id)
-        if user:
-            username = user.username
+    identity = current_user()
+    username = identity["username"] if identity else None
     
+    forget_current_user()
     session.clear()
     logger.info(f"User {username} logged out")
     return jsonify({"ok": True, "msg": "logout successful"}), 200
@@ -430,17 +470,12 @@ def me():
         }
     """
     
-    # Get user ID from session
-    user_id = session.get("user_id")
-    if not user_id:
+    # Resolve the session's user (cached per process, see auth/identity.py)
+    identity = current_user()
+    if not identity:
         return jsonify({"user": None}), 200
     
-    # Look up the user
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({"user": None}), 200
-    
-    return jsonify({"user": {"id": user.id, "username": user.username, "email": user.email}}), 200
+    return jsonify({"user": identity}), 200
 
 
 # Check username/email availability endpoint
@@ -472,18 +507,32 @@ def check_availability():
     email = (data.get("email") or "").strip().lower()
 
     resp = {}
-    
+
+    # Names nobody has are answered from memory (auth/availability.py);
+    # possible matches are confirmed with a single query
+    taken = check_taken(username=username, email=email)
+
     # Check if username is available (not already taken)
     if username:
-        resp["username_available"] = User.query.filter_by(username=username).first() is None
+        resp["username_available"] = not taken["username"]
     
     # Check if email is available (not already registered)
     if email:
-        resp["email_available"] = User.query.filter_by(email=email).first() is None
+        resp["email_available"] = not taken["email"]
 
     return jsonify(resp), 200
 
 
+# Counters of the background cleanup of abandoned sign-ups (auth/pending_sweeper.py)
+@auth.route("/pending-sweeper/stats", methods=["GET"])
+def pending_sweeper_stats():
+    """Runs and purged rows of this worker's PendingSweeper (needs STATS_TOKEN)"""
+    error = require_stats_token()
+    if error:
+        return error
+    return jsonify(sweeper_stats()), 200
+
+
 # Helper function to validate registration json
 def validate_registration_payload(data):
     """
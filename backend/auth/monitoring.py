@@ -0,0 +1,29 @@
+# backend/auth/monitoring.py
+"""
+Access control for the monitoring endpoints
+
+The */stats endpoints expose internal counters (cache contents, queue
+depths, sweeper progress) that are meant for operators, not for anyone who
+can reach the API. They require the token configured in STATS_TOKEN:
+
+    curl -H "Authorization: Bearer $STATS_TOKEN" http://localhost:5001/products/cache/stats
+
+Without STATS_TOKEN set, the endpoints refuse every request.
+"""
+import hmac
+import os
+
+from flask import jsonify, request
+
+
+def require_stats_token():
+    """Return None if the request carries the stats token, otherwise an error response"""
+    header = request.headers.get("Authorization", "")
+    if not header.startswith("Bearer "):
+        return jsonify({"error": "authentication required"}), 401
+    token = header[len("Bearer "):].strip()
+    # Read per request: app.py loads .env only after its imports
+    expected = os.environ.get("STATS_TOKEN", "")
+    if not expected or not hmac.compare_digest(token.encode(), expected.encode()):
+        return jsonify({"error": "permission denied"}), 403
+    return None
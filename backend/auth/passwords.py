@@ -0,0 +1,119 @@
+"""
+Password hashing off the event loop
+
+generate_password_hash / check_password_hash are deliberately slow (tens to
+hundreds of milliseconds of CPU). The Socket.IO server runs under gevent, so
+hashing directly in a request handler freezes every greenlet on the worker -
+all live chat connections included - until the hash is done; a burst of
+logins freezes chat for seconds.
+
+hash_password() and verify_password() run the hash in a native thread
+instead: gevent's hub threadpool when called from a greenlet, a regular
+ThreadPoolExecutor otherwise. The KDFs in hashlib release the GIL while they
+work, so the event loop keeps serving other connections meanwhile.
+
+The number of hashes waiting or running is bounded (PASSWORD_HASH_MAX_PENDING);
+beyond that PasswordHasherBusy is raised and the route answers 503, instead
+of an ever-growing backlog of logins that will all time out anyway.
+
+The hash method is configurable (PASSWORD_HASH_METHOD, any werkzeug method
+string such as "scrypt:32768:8:1" or "pbkdf2:sha256:1000000");
+needs_rehash() tells login when a stored hash uses other parameters so it
+can be upgraded transparently.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+try:
+    import gevent
+    from gevent.threadpool import ThreadPool as GeventThreadPool
+except ImportError:  # gevent not installed - only the executor is used
+    gevent = None
+    GeventThreadPool = None
+
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+MAX_PENDING = int(os.environ.get("PASSWORD_HASH_MAX_PENDING", HASH_WORKERS * 16))
+
+
+class PasswordHasherBusy(Exception):
+    """Too many hashes are already queued; the caller should answer 503"""
+
+
+class PasswordHasher:
+    def __init__(self, method=HASH_METHOD, workers=HASH_WORKERS, max_pending=MAX_PENDING):
+        self.method = method
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._gevent_pool = None
+        self._pool_lock = threading.Lock()
+        self._method_prefix = None
+        self.rejected = 0
+
+    def _in_greenlet(self):
+        # Requests and Socket.IO handlers under the gevent server run in spawned
+        # greenlets; a plain thread (dev server, scripts) doesn't
+        return gevent is not None and isinstance(gevent.getcurrent(), gevent.Greenlet)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy("password hashing queue is full")
+        try:
+            if self._in_greenlet():
+                return self._gevent_threadpool().apply(fn, args)
+            return self._thread_executor().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _gevent_threadpool(self):
+        with self._pool_lock:
+            if self._gevent_pool is None:
+                self._gevent_pool = GeventThreadPool(self.workers)
+            return self._gevent_pool
+
+    def _thread_executor(self):
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def method_prefix(self):
+        """The "<method>:<params>" part werkzeug writes for the configured method"""
+        if self._method_prefix is None:
+            # e.g. "scrypt" is stored as "scrypt:32768:8:1"; the defaults werkzeug
+            # fills in are learned once from a real hash
+            self._method_prefix = self.hash("").split("$", 1)[0]
+        return self._method_prefix
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with a different method or parameters"""
+        try:
+            return password_hash.split("$", 1)[0] != self.method_prefix()
+        except PasswordHasherBusy:
+            return False  # can't tell right now; checked again on the next login
+
+
+password_hasher = PasswordHasher()
+
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+
+def verify_password(password_hash, password):
+    return password_hasher.verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return password_hasher.needs_rehash(password_hash)
@@ -0,0 +1,149 @@
+# backend/auth/pending_sweeper.py
+"""
+Background cleanup of abandoned sign-ups
+
+A PendingVerification row used to be deleted only when the same email came
+back to /auth/verify-email after the code expired, so every sign-up that was
+never finished stayed in the table forever.
+
+PendingSweeper, a background thread started by init_pending_sweeper(),
+deletes rows whose code expired more than PENDING_VERIFICATION_GRACE_SECONDS
+ago (/auth/resend-code still works on a recently expired row, so those are
+kept for a while). It runs every PENDING_SWEEP_INTERVAL_SECONDS and deletes
+at most PENDING_SWEEP_CHUNK_SIZE rows per transaction, with a short pause
+between chunks, so a large backlog never holds the SQLite write lock for
+long and registrations keep going through meanwhile.
+
+Its counters are served at GET /auth/pending-sweeper/stats (auth/login.py).
+
+A sweep can also be run once, synchronously, with:
+    python -m auth.pending_sweeper
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, PendingVerification
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL_SECONDS = int(os.environ.get("PENDING_SWEEP_INTERVAL_SECONDS", 300))
+GRACE_SECONDS = int(os.environ.get("PENDING_VERIFICATION_GRACE_SECONDS", 3600))
+CHUNK_SIZE = int(os.environ.get("PENDING_SWEEP_CHUNK_SIZE", 500))
+# Pause between chunks so other writers get the lock
+CHUNK_PAUSE_SECONDS = 0.05
+
+
+def purge_expired_chunk(cutoff, limit=CHUNK_SIZE):
+    """Delete up to `limit` rows that expired before `cutoff`; returns how many were deleted"""
+    expired_ids = (
+        db.session.query(PendingVerification.id)
+        .filter(PendingVerification.expires_at < cutoff)
+        .order_by(PendingVerification.expires_at)
+        .limit(limit)
+        .scalar_subquery()
+    )
+    deleted = PendingVerification.query.filter(
+        PendingVerification.id.in_(expired_ids)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+class PendingSweeper:
+    def __init__(self, app, interval=SWEEP_INTERVAL_SECONDS, grace=GRACE_SECONDS, chunk_size=CHUNK_SIZE):
+        self.app = app
+        self.interval = interval
+        self.grace = timedelta(seconds=grace)
+        self.chunk_size = chunk_size
+        self._thread = None
+        self.runs = 0
+        self.purged_total = 0
+        self.last_purged = 0
+        self.last_chunks = 0
+        self.last_duration_ms = 0.0
+        self.last_run_at = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="pending-sweeper", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Pending verification sweep failed: {e}")
+            time.sleep(self.interval)
+
+    def sweep(self):
+        """Delete all rows past the grace period, one chunk per transaction; returns the count"""
+        started = time.perf_counter()
+        purged = 0
+        chunks = 0
+        with self.app.app_context():
+            # Fixed for the whole run, so rows expiring meanwhile wait for the next one
+            cutoff = datetime.utcnow() - self.grace
+            try:
+                while True:
+                    deleted = purge_expired_chunk(cutoff, self.chunk_size)
+                    purged += deleted
+                    chunks += 1
+                    if deleted < self.chunk_size:
+                        break
+                    time.sleep(CHUNK_PAUSE_SECONDS)
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                self.runs += 1
+                self.purged_total += purged
+                self.last_purged = purged
+                self.last_chunks = chunks
+                self.last_duration_ms = (time.perf_counter() - started) * 1000
+                self.last_run_at = datetime.utcnow()
+        if purged:
+            logger.info(f"Purged {purged} expired pending verification(s) in {chunks} chunk(s), "
+                        f"{self.last_duration_ms:.0f}ms")
+        return purged
+
+    def stats(self):
+        return {
+            "runs": self.runs,
+            "purged_total": self.purged_total,
+            "last_purged": self.last_purged,
+            "last_chunks": self.last_chunks,
+            "last_duration_ms": round(self.last_duration_ms, 1),
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
+
+
+_sweeper = None
+
+
+def init_pending_sweeper(app):
+    """
+    Start the sweeper for this process
+
+    PENDING_SWEEPER=0 disables it (e.g. on all but one worker; running it on
+    several is harmless, just redundant).
+    """
+    global _sweeper
+    _sweeper = PendingSweeper(app)
+    if os.environ.get("PENDING_SWEEPER", "1") != "0":
+        _sweeper.start()
+    return _sweeper
+
+
+def sweeper_stats():
+    return _sweeper.stats() if _sweeper is not None else None
+
+
+if __name__ == "__main__":
+    from app import app as flask_app
+    sweeper = PendingSweeper(flask_app)
+    sweeper.sweep()
+    print(f"Sweep done: {sweeper.stats()}")
@@ -0,0 +1,244 @@
+# backend/auth/ratelimit_storage.py
+"""
+Shared rate-limit storage backed by a SQLite file
+
+With storage_uri="memory://" every worker process keeps its own counters:
+running four workers quietly allows four times the configured limits, and
+every restart forgets them. SQLiteStorage keeps the counters in one SQLite
+file that all workers on the machine open, so a limit holds across workers
+and restarts without a network round-trip to Redis or Memcached.
+
+Importing this module registers the "sqlite" scheme with the `limits`
+library, so Flask-Limiter picks it up from the storage URI alone:
+
+    RATELIMIT_STORAGE_URI=sqlite:///instance/ratelimit.db     (default)
+    RATELIMIT_STORAGE_URI=sqlite:////var/lib/market/ratelimit.db
+    RATELIMIT_STORAGE_URI=memory://                           per-process, as before
+    RATELIMIT_STORAGE_URI=redis://localhost:6379/0            needs the `redis` package
+
+All three Flask-Limiter strategies are supported (RATELIMIT_STRATEGY):
+fixed-window, moving-window and sliding-window-counter. Each hit is a single
+short transaction on a WAL database with synchronous=NORMAL, i.e. no fsync
+per request; see benchmarks/ratelimit_bench.py for the per-hit cost.
+"""
+import os
+import sqlite3
+import threading
+import time
+from math import floor
+
+from limits.storage.base import (
+    MovingWindowSupport,
+    SlidingWindowCounterSupport,
+    Storage,
+    TimestampedSlidingWindow,
+)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUSY_TIMEOUT_SECONDS = 5
+# Expired counters and window entries are deleted at most this often
+PRUNE_INTERVAL_SECONDS = 60
+# Where the app keeps its counters unless RATELIMIT_STORAGE_URI says otherwise
+DEFAULT_STORAGE_URI = "sqlite:///instance/ratelimit.db"
+
+
+class SQLiteStorage(Storage, MovingWindowSupport, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    `limits` storage keeping counters in a SQLite file shared by all workers
+
+    Counters (fixed window, sliding window counter) live in one row per key
+    with their expiry time; moving windows store one row per acquired entry.
+    Every check-and-increment runs in a BEGIN IMMEDIATE transaction, so two
+    workers can't both take the last slot of a limit.
+    """
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        path = uri[len("sqlite:///"):] if uri.startswith("sqlite:///") else ""
+        # Relative paths are relative to the backend folder, like instance/users.db
+        self.path = os.path.join(BACKEND_DIR, path) if path else ":memory:"
+        self.timeout = float(options.get("timeout", BUSY_TIMEOUT_SECONDS))
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._last_prune = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        # A connection must not be shared with a forked child (gunicorn --preload)
+        if self._conn is None or self._conn_pid != os.getpid():
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit_counter ("
+                " key TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit_window ("
+                " key TEXT NOT NULL,"
+                " acquired_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_ratelimit_window_key_acquired"
+                " ON ratelimit_window (key, acquired_at)"
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, fn, *args):
+        """Run fn(conn, now, *args) inside BEGIN IMMEDIATE ... COMMIT"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                result = fn(conn, now, *args)
+                if now - self._last_prune > PRUNE_INTERVAL_SECONDS:
+                    conn.execute("DELETE FROM ratelimit_counter WHERE expires_at <= ?", (now,))
+                    conn.execute("DELETE FROM ratelimit_window WHERE expires_at <= ?", (now,))
+                    self._last_prune = now
+                conn.execute("COMMIT")
+                return result
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _read(self, sql, params):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchone()
+
+    # Fixed window counters
+
+    @staticmethod
+    def _incr(conn, now, key, expiry, amount):
+        # An expired counter starts over at `amount` with a fresh expiry
+        (value,) = conn.execute(
+            "INSERT INTO ratelimit_counter (key, value, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(key) DO UPDATE SET"
+            " value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END,"
+            " expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END"
+            " RETURNING value",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        return value
+
+    @staticmethod
+    def _get(conn, now, key):
+        row = conn.execute(
+            "SELECT value FROM ratelimit_counter WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, key, expiry, amount=1):
+        return self._transaction(self._incr, key, expiry, amount)
+
+    def get(self, key):
+        row = self._read(
+            "SELECT value FROM ratelimit_counter WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        now = time.time()
+        row = self._read(
+            "SELECT expires_at FROM ratelimit_counter WHERE key = ? AND expires_at > ?", (key, now)
+        )
+        return row[0] if row else now
+
+    def clear(self, key):
+        def _clear(conn, now):
+            conn.execute("DELETE FROM ratelimit_counter WHERE key = ?", (key,))
+            conn.execute("DELETE FROM ratelimit_window WHERE key = ?", (key,))
+        self._transaction(_clear)
+
+    def reset(self):
+        def _reset(conn, now):
+            counters = conn.execute("DELETE FROM ratelimit_counter").rowcount
+            entries = conn.execute("SELECT COUNT(DISTINCT key) FROM ratelimit_window").fetchone()[0]
+            conn.execute("DELETE FROM ratelimit_window")
+            return max(counters, entries)
+        return self._transaction(_reset)
+
+    def check(self):
+        try:
+            self._read("SELECT 1", ())
+            return True
+        except sqlite3.Error:
+            return False
+
+    # Moving window
+
+    def acquire_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        def _acquire(conn, now):
+            (count,) = conn.execute(
+                "SELECT COUNT(*) FROM ratelimit_window WHERE key = ? AND acquired_at > ?",
+                (key, now - expiry),
+            ).fetchone()
+            if count + amount > limit:
+                return False
+            conn.executemany(
+                "INSERT INTO ratelimit_window (key, acquired_at, expires_at) VALUES (?, ?, ?)",
+                [(key, now, now + expiry)] * amount,
+            )
+            return True
+        return self._transaction(_acquire)
+
+    def get_moving_window(self, key, limit, expiry):
+        now = time.time()
+        oldest, count = self._read(
+            "SELECT MIN(acquired_at), COUNT(*) FROM ratelimit_window WHERE key = ? AND acquired_at > ?",
+            (key, now - expiry),
+        )
+        return (oldest, count) if count else (now, 0)
+
+    # Sliding window counter
+
+    def _sliding_window(self, conn, now, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(conn, now, previous_key)
+        current_count = self._get(conn, now, current_key)
+        if previous_count == 0:
+            previous_ttl = 0.0
+        else:
+            previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+
+        def _acquire(conn, now):
+            previous_count, previous_ttl, current_count, _ = self._sliding_window(conn, now, key, expiry)
+            weighted_count = previous_count * previous_ttl / expiry + current_count
+            if floor(weighted_count) + amount > limit:
+                return False
+            # The current window's counter also weighs in on the next window,
+            # so it is kept for twice the window length
+            _, current_key = self.sliding_window_keys(key, expiry, now)
+            self._incr(conn, now, current_key, 2 * expiry, amount)
+            return True
+        return self._transaction(_acquire)
+
+    def get_sliding_window(self, key, expiry):
+        with self._lock:
+            return self._sliding_window(self._connection(), time.time(), key, expiry)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
@@ -0,0 +1,97 @@
+# backend/benchmarks/ratelimit_bench.py
+"""
+Per-request overhead of the rate-limit storages
+
+Times limiter.hit() - what Flask-Limiter does once per applied limit on
+every request - for memory:// and the shared SQLite storage, with each
+strategy, and checks that the SQLite storage enforces one limit across
+several processes.
+
+Run from the backend folder:
+
+    python -m benchmarks.ratelimit_bench
+    python -m benchmarks.ratelimit_bench --hits 20000 --processes 8
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import STRATEGIES
+
+# importing it registers the "sqlite" storage scheme
+from auth import ratelimit_storage
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_hits(storage_uri, strategy, hits, keys):
+    """Microseconds per hit (p50, p99, mean) over `hits` hits spread over `keys` keys"""
+    limiter = STRATEGIES[strategy](storage_from_string(storage_uri))
+    item = parse("1000000 per hour")
+    samples = []
+    for i in range(hits):
+        key = f"10.0.{i % keys // 256}.{i % 256}"
+        start = time.perf_counter()
+        limiter.hit(item, key)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return _percentile(samples, 50), _percentile(samples, 99), statistics.fmean(samples)
+
+
+def _worker(storage_uri, strategy, limit, attempts, results):
+    limiter = STRATEGIES[strategy](storage_from_string(storage_uri))
+    item = parse(f"{limit} per hour")
+    results.put(sum(1 for _ in range(attempts) if limiter.hit(item, "shared-client")))
+
+
+def shared_limit_check(storage_uri, strategy, processes, limit):
+    """Total hits allowed when `processes` workers race for one limit"""
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_worker, args=(storage_uri, strategy, limit, limit, results))
+        for _ in range(processes)
+    ]
+    for w in workers:
+        w.start()
+    allowed = sum(results.get() for _ in workers)
+    for w in workers:
+        w.join()
+    return allowed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hits", type=int, default=5000)
+    parser.add_argument("--keys", type=int, default=1000, help="distinct client addresses")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_uri = f"sqlite:///{os.path.join(tmp, 'ratelimit.db')}"
+        # make sure the URI really reaches the shared storage, not a fallback
+        assert isinstance(storage_from_string(sqlite_uri), ratelimit_storage.SQLiteStorage)
+
+        print(f"{'storage':<10} {'strategy':<24} {'p50 us':>8} {'p99 us':>8} {'mean us':>8}")
+        for label, uri in (("memory", "memory://"), ("sqlite", sqlite_uri)):
+            for strategy in STRATEGIES:
+                p50, p99, mean = time_hits(uri, strategy, args.hits, args.keys)
+                print(f"{label:<10} {strategy:<24} {p50:>8.1f} {p99:>8.1f} {mean:>8.1f}")
+
+        print()
+        print(f"{args.processes} processes x {args.limit} attempts against a limit of {args.limit}:")
+        for label, uri in (("memory", "memory://"), ("sqlite", sqlite_uri)):
+            for strategy in STRATEGIES:
+                allowed = shared_limit_check(uri, strategy, args.processes, args.limit)
+                print(f"  {label:<8} {strategy:<24} allowed {allowed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+# backend/benchmarks/suite.py
+"""
+Latency / throughput benchmark for the HTTP routes and Socket.IO events
+
+Seeds a fresh SQLite database in a temporary folder (init_db.seed_database),
+then drives each scenario below from several concurrent clients - greenlets
+using Flask and Socket.IO test clients against the app in this process, as
+under the gevent server - and reports per scenario:
+
+    ops/s     throughput while the scenario ran
+    p50/p95/p99 latency in milliseconds
+    queries   average SQL statements per operation (request or event handler;
+              the message writer's batched inserts run in the background and
+              are not counted)
+    max q     most SQL statements any single operation issued
+    errors    responses with status >= 500 (or messages never delivered)
+
+The product scenarios run with the product response cache off, so they
+measure the queries themselves; the `.cached` variants run similar requests
+with the cache on, after a warm-up that issues exactly the measured requests,
+so they measure the hit path.
+
+Everything runs offline in one process; no server, network or email. Like
+app.py, the suite does not monkey-patch the standard library: the app runs
+with Flask-SocketIO's gevent async mode over unpatched sockets, threads and
+locks, exactly as `python app.py` serves it, so a blocking call in a handler
+stalls the other clients here just as it would in production.
+
+    python -m benchmarks.suite                    # run, compare with baseline.json
+    python -m benchmarks.suite --save-baseline    # run and record a new baseline
+    python -m benchmarks.suite --only products.list,socket.send_message
+
+The exit status is 1 when a scenario regressed against the baseline: p95
+latency more than --tolerance above it (ignoring differences under 1ms), a
+higher max queries per operation (uncached scenarios only - the average
+depends on which requests were drawn, and for cached ones on the hit rate),
+or new errors. Latencies depend on the machine, so record the baseline on
+the machine you compare on; query counts don't.
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import gevent
+from gevent.event import Event
+from gevent.local import local
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Latency differences below this are noise, whatever the percentage
+NOISE_FLOOR_MS = 1.0
+# Response cache size for the .cached scenarios (the app's default)
+RESPONSE_CACHE_ENTRIES = 1024
+
+# Greenlet-local: each client counts its own queries
+_queries = local()
+
+
+@sa_event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if hasattr(_queries, "count"):
+        _queries.count += 1
+
+
+class BenchContext:
+    """The app under test plus one logged-in client (and socket) per concurrent worker"""
+
+    def __init__(self, app_module, dataset, concurrency):
+        self.app = app_module.app
+        self.socketio = app_module.socketio
+        self.dataset = dataset
+        self.clients = []
+        self.sockets = []
+        self.delivered = {}
+        self.ids = itertools.count()
+
+        for w in range(concurrency):
+            client = self.app.test_client()
+            with client.session_transaction() as session:
+                session["user_id"] = w + 1
+            self.clients.append(client)
+
+        # Resolve the waiting sender when the writer emits its message
+        original_emit = self.socketio.emit
+
+        def emit(event, data=None, *args, **kwargs):
+            if event == "new_message" and isinstance(data, dict):
+                waiter = self.delivered.get(data.get("client_id"))
+                if waiter is not None:
+                    waiter.set()
+            return original_emit(event, data, *args, **kwargs)
+        self.socketio.emit = emit
+
+        for client in self.clients:
+            self.sockets.append(self.socketio.test_client(self.app, flask_test_client=client))
+
+    def random_user(self, rng):
+        return rng.randint(1, self.dataset["users"])
+
+
+# Scenarios: fn(ctx, worker, rng) -> status code
+
+def products_list(ctx, w, rng):
+    url = f"/products?page={rng.randint(1, 5)}"
+    if rng.random() < 0.5:
+        url += f"&category={rng.choice(['textbooks', 'electronics', 'furniture', 'clothing'])}"
+    return ctx.clients[w].get(url).status_code
+
+
+def search_terms(rng):
+    """A search box entry: one or two words, a prefix being typed, or a miss"""
+    from init_db import WORDS
+    kind = rng.random()
+    if kind < 0.4:
+        return rng.choice(WORDS)
+    if kind < 0.7:
+        return " ".join(rng.sample(WORDS, 2))
+    if kind < 0.9:
+        word = rng.choice(WORDS)
+        return word[:rng.randint(2, len(word) - 1)]
+    return "".join(rng.choice("bcdfghjklmnpqrstvwxz") for _ in range(6))
+
+
+def products_search(ctx, w, rng):
+    args = {"q": search_terms(rng)}
+    if rng.random() < 0.3:
+        args.update(sort="price", order="asc", page=rng.randint(1, 3))
+    return ctx.clients[w].get("/products", query_string=args).status_code
+
+
+def products_popular_search(ctx, w, rng):
+    # the same few searches over and over: what the response cache is for
+    from init_db import WORDS
+    return ctx.clients[w].get(f"/products?q={rng.choice(WORDS[:8])}").status_code
+
+
+def products_detail(ctx, w, rng):
+    return ctx.clients[w].get(f"/products/{rng.randint(1, ctx.dataset['products'])}").status_code
+
+
+def products_popular_detail(ctx, w, rng):
+    return ctx.clients[w].get(f"/products/{rng.randint(1, 50)}").status_code
+
+
+def products_user(ctx, w, rng):
+    return ctx.clients[w].get(f"/products/user/{ctx.random_user(rng)}").status_code
+
+
+def auth_me(ctx, w, rng):
+    return ctx.clients[w].get("/auth/me").status_code
+
+
+def auth_check(ctx, w, rng):
+    body = {"username": f"newcomer{rng.randint(1, 10 ** 6)}"}
+    if rng.random() < 0.3:
+        body["username"] = f"user{ctx.random_user(rng)}"  # taken
+    return ctx.clients[w].post("/auth/check", json=body).status_code
+
+
+def messages_page(ctx, w, rng):
+    a, b = rng.choice(ctx.dataset["pairs"])
+    return ctx.clients[w].get(f"/api/messages?user1={a}&user2={b}").status_code
+
+
+def messages_conversations(ctx, w, rng):
+    return ctx.clients[w].get("/api/messages/conversations").status_code
+
+
+def messages_inbox(ctx, w, rng):
+    return ctx.clients[w].get(f"/api/messages/inbox?recipient={w + 1}").status_code
+
+
+def socket_connect(ctx, w, rng):
+    # a reconnect that missed up to 200 messages
+    last_seen_id = max(0, ctx.dataset["messages"] - rng.randint(0, 200))
+    sc = ctx.socketio.test_client(ctx.app, flask_test_client=ctx.clients[w],
+                                  auth={"last_seen_id": last_seen_id})
+    connected = sc.is_connected()
+    sc.disconnect()
+    return 200 if connected else 500
+
+
+def socket_send_message(ctx, w, rng):
+    # latency until the message is committed and new_message is emitted
+    client_id = f"bench-{w}-{next(ctx.ids)}"
+    delivered = ctx.delivered[client_id] = Event()
+    try:
+        ctx.sockets[w].emit("send_message", {
+            "recipient_id": ctx.random_user(rng),
+            "body": "is this still available?",
+            "client_id": client_id,
+        })
+        return 200 if delivered.wait(5) else 504
+    finally:
+        ctx.delivered.pop(client_id, None)
+
+
+SCENARIOS = {
+    "products.list": products_list,
+    "products.list.cached": products_list,
+    "products.search": products_search,
+    "products.search.cached": products_popular_search,
+    "products.detail": products_detail,
+    "products.detail.cached": products_popular_detail,
+    "products.user": products_user,
+    "auth.me": auth_me,
+    "auth.check": auth_check,
+    "messages.page": messages_page,
+    "messages.conversations": messages_conversations,
+    "messages.inbox": messages_inbox,
+    "socket.connect": socket_connect,
+    "socket.send_message": socket_send_message,
+}
+
+
+# Scenarios run with the product response cache on; all others run with it off
+RESPONSE_CACHED = {"products.list.cached", "products.search.cached", "products.detail.cached"}
+
+
+def use_response_cache(enabled):
+    """Turn the product response cache on or off (starting empty either way)"""
+    from products.cache import product_cache
+    product_cache.max_entries = RESPONSE_CACHE_ENTRIES if enabled else 0
+    product_cache.clear()
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_scenario(ctx, name, fn, concurrency, ops, warmup, seed, replay_warmup=False):
+    """
+    Run fn `warmup` times per client unrecorded, then `ops` times recorded
+
+    With replay_warmup the warm-up instead issues exactly the requests that
+    are then measured, so with a response cache on every measured request is
+    a hit whatever --ops is.
+    """
+    samples, queries, errors = [], [], [0]
+
+    def worker(w, count, record, stream):
+        rng = random.Random(f"{seed}-{name}-{w}-{stream}")
+        for _ in range(count):
+            _queries.count = 0
+            started = time.perf_counter()
+            status = fn(ctx, w, rng)
+            elapsed = time.perf_counter() - started
+            if record:
+                samples.append(elapsed * 1000)
+                queries.append(_queries.count)
+                if status >= 500:
+                    errors[0] += 1
+
+    if replay_warmup:
+        warm_up = [gevent.spawn(worker, w, ops, False, "measured") for w in range(concurrency)]
+    else:
+        warm_up = [gevent.spawn(worker, w, warmup, False, "warmup") for w in range(concurrency)]
+    gevent.joinall(warm_up, raise_error=True)
+    started = time.perf_counter()
+    gevent.joinall([gevent.spawn(worker, w, ops, True, "measured") for w in range(concurrency)], raise_error=True)
+    wall = time.perf_counter() - started
+
+    ordered = sorted(samples)
+    return {
+        "ops": len(samples),
+        "ops_per_sec": round(len(samples) / wall, 1),
+        "p50_ms": round(_percentile(ordered, 50), 3),
+        "p95_ms": round(_percentile(ordered, 95), 3),
+        "p99_ms": round(_percentile(ordered, 99), 3),
+        "queries_per_op": round(sum(queries) / len(queries), 2),
+        "max_queries_per_op": max(queries),
+        "errors": errors[0],
+    }
+
+
+def compare(results, baseline, tolerance):
+    """List of human-readable regressions against the baseline"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if (current["p95_ms"] > base["p95_ms"] * (1 + tolerance)
+                and current["p95_ms"] - base["p95_ms"] > NOISE_FLOOR_MS):
+            regressions.append(f"{name}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if name not in RESPONSE_CACHED and current["max_queries_per_op"] > base["max_queries_per_op"]:
+            regressions.append(
+                f"{name}: max queries/op {base['max_queries_per_op']} -> {current['max_queries_per_op']}")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {current['errors']}")
+    return regressions
+
+
+def load_app(workdir):
+    """Import the app against a fresh database in workdir, with background workers off"""
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "MESSAGES_DATABASE_URL": "",
+        "SOCKETIO_MESSAGE_QUEUE": "",
+        "RATELIMIT_STORAGE_URI": "memory://",
+        "EMAIL_TRANSPORT": "fake",
+        "EMAIL_OUTBOX_WORKER": "0",
+        "PENDING_SWEEPER": "0",
+    })
+    import app as app_module
+    app_module.limiter.enabled = False
+    # Per-request / per-event INFO logging would dominate the timings
+    logging.disable(logging.INFO)
+    return app_module
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=50, help="operations per client per scenario")
+    parser.add_argument("--warmup", type=int, default=5,
+                        help="unrecorded operations per client first (at least 1)")
+    parser.add_argument("--only", help="comma-separated scenario names")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 increase (0.25 = 25%%)")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    if args.warmup < 1:
+        # the per-process identity cache must be warm, or the first
+        # operation of each client issues extra queries
+        parser.error("--warmup must be at least 1")
+    params = {k: getattr(args, k) for k in ("users", "products", "messages", "seed", "concurrency", "ops")}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        app_module = load_app(workdir)
+        from auth.availability import availability_index
+        from init_db import seed_database
+
+        started = time.perf_counter()
+        with app_module.app.app_context():
+            # URL-only image rows: nothing is written to the upload folder
+            dataset = seed_database(args.users, args.products, args.messages, args.seed,
+                                    with_image_files=False, quiet=True)
+            # The index was warmed at import, on the empty database; catch up
+            # now so the first signup checks don't pay for loading every user
+            availability_index.refresh(max_age=0)
+        print(f"Seeded {args.users} users, {args.products} products, {args.messages} messages "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        ctx = BenchContext(app_module, dataset, args.concurrency)
+        print(f"{args.concurrency} concurrent clients x {args.ops} ops per scenario\n")
+        print(f"{'scenario':<24} {'ops/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'queries':>8} {'max q':>6} {'errors':>7}")
+        results = {}
+        for name in names:
+            cached = name in RESPONSE_CACHED
+            use_response_cache(cached)
+            r = results[name] = run_scenario(ctx, name, SCENARIOS[name], args.concurrency,
+                                             args.ops, args.warmup, args.seed, replay_warmup=cached)
+            print(f"{name:<24} {r['ops_per_sec']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+                  f"{r['p99_ms']:>8} {r['queries_per_op']:>8} {r['max_queries_per_op']:>6} {r['errors']:>7}")
+
+    report = {"params": params, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare with (run with --save-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("params") != params:
+        print(f"\nNote: baseline was recorded with {baseline.get('params')}")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for line in regressions:
+            print(f"  !! {line}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
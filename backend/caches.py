@@ -0,0 +1,153 @@
+# backend/caches.py
+"""
+In-process caches shared by the auth, chat and product code
+
+LRUCache is the one bounded map behind the identity cache (auth/identity.py),
+the username cache (usernames.py) and the product response cache
+(products/cache.py): thread-safe, least recently used entries evicted once
+max_entries is reached, entries optionally expiring after `ttl` seconds, with
+hit / miss / eviction / expiration counters for the stats endpoints.
+
+Caches holding per-user data register a callback with on_user_changed();
+the mapper events at the bottom call every callback with the user's id
+whenever this process updates or deletes a User, so each cache drops its
+entry. Changes made by other processes show up once an entry's TTL runs out.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from models import User
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU map with an optional per-entry TTL
+
+    max_entries <= 0 disables the cache (set() stores nothing). ttl=None means
+    entries never expire. Both can be changed at runtime; a new ttl applies
+    to entries stored from then on.
+
+    Subclasses that keep derived state (e.g. a reverse index) override
+    _stored() / _removed(), which run under the lock, and extend clear().
+    """
+
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, key, now):
+        # Caller holds the lock; returns the entry or None, counting the outcome
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= now:
+            self._remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def get(self, key, default=None):
+        """The cached value for key, or `default` if it is missing or expired"""
+        with self._lock:
+            entry = self._lookup(key, time.monotonic())
+        return default if entry is None else entry[1]
+
+    def get_many(self, keys):
+        """Return ({key: value} for the cached keys, [keys that missed])"""
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._lookup(key, now)
+                if entry is None:
+                    missing.append(key)
+                else:
+                    found[key] = entry[1]
+        return found, missing
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries if full"""
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, value)
+            self._stored(key, value)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def forget(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def forget_where(self, predicate):
+        """Drop every entry whose value satisfies predicate(value); returns how many"""
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._removed(key, value)
+
+    def _stored(self, key, value):
+        pass
+
+    def _removed(self, key, value):
+        pass
+
+
+_user_change_callbacks = []
+
+
+def on_user_changed(callback):
+    """Call callback(user_id) whenever this process updates or deletes a User"""
+    _user_change_callbacks.append(callback)
+    return callback
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    for callback in _user_change_callbacks:
+        callback(target.id)
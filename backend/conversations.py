@@ -0,0 +1,142 @@
+# backend/conversations.py
+"""
+Maintains the Conversation summary rows behind the inbox
+
+Each Message insert upserts two Conversation rows in the same transaction:
+
+- the sender's row for (sender, recipient): new last message, unread unchanged
+- the recipient's row for (recipient, sender): new last message, unread + 1
+
+This hangs off the Message mapper's after_insert event, so every write path
+(POST /api/messages, the Socket.IO send_message handler, scripts) keeps the
+summaries current without having to remember to. The upsert is a single
+INSERT ... ON CONFLICT DO UPDATE per row, so two messages racing into the same
+conversation can't lose an unread increment.
+
+mark_read() resets a row's unread count; rebuild_conversations() recreates
+every row from the message table (run automatically when the table is
+first created, and by `python -m conversations`).
+"""
+import logging
+
+from sqlalchemy import event, func, insert, literal, select, union_all
+
+from database import dialect_insert
+from models import db, Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+conversation_table = Conversation.__table__
+
+
+def upsert_conversation(connection, user_id, peer_id, message, unread_increment):
+    """Point (user_id, peer_id)'s summary at `message`, adding to its unread count"""
+    values = {
+        "last_message_id": message.id,
+        "last_sender_id": message.sender_id,
+        "last_message_body": message.body,
+        "last_activity_at": message.created_at,
+    }
+    stmt = dialect_insert(connection)(conversation_table).values(
+        user_id=user_id, peer_id=peer_id, unread_count=unread_increment, **values
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'peer_id'],
+        set_={**values, "unread_count": conversation_table.c.unread_count + unread_increment},
+    )
+    connection.execute(stmt)
+
+
+@event.listens_for(Message, "after_insert")
+def _record_message(mapper, connection, message):
+    upsert_conversation(connection, message.sender_id, message.recipient_id, message, 0)
+    if message.recipient_id != message.sender_id:
+        upsert_conversation(connection, message.recipient_id, message.sender_id, message, 1)
+
+
+def list_conversations(user_id, limit=50):
+    """A user's conversations, most recent activity first (one indexed read)"""
+    return (
+        Conversation.query
+        .filter(Conversation.user_id == user_id)
+        .order_by(Conversation.last_activity_at.desc(), Conversation.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def mark_read(user_id, peer_id, up_to_id=None):
+    """
+    Mark the conversation with peer_id as read up to message up_to_id
+    (default: everything so far) and return the updated Conversation, or None
+
+    The unread count is recomputed in SQL from the messages newer than the
+    marker, so a message arriving concurrently is never counted as read.
+    """
+    conversation = Conversation.query.filter_by(user_id=user_id, peer_id=peer_id).first()
+    if conversation is None:
+        return None
+    if up_to_id is None:
+        up_to_id = conversation.last_message_id
+    if conversation.last_read_message_id is not None:
+        up_to_id = max(up_to_id, conversation.last_read_message_id)
+
+    still_unread = (
+        select(func.count(Message.id))
+        .where(Message.sender_id == peer_id, Message.recipient_id == user_id, Message.id > up_to_id)
+        .scalar_subquery()
+    )
+    Conversation.query.filter_by(id=conversation.id).update(
+        {Conversation.unread_count: still_unread, Conversation.last_read_message_id: up_to_id},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    db.session.refresh(conversation)
+    return conversation
+
+
+def rebuild_conversations():
+    """
+    Recreate every Conversation row from the message table
+
+    Existing unread counts and read markers are discarded; messages sent
+    before read markers existed are treated as read.
+    Returns the number of rows created.
+    """
+    sides = union_all(
+        select(Message.sender_id.label('user_id'), Message.recipient_id.label('peer_id'), Message.id.label('message_id')),
+        select(Message.recipient_id, Message.sender_id, Message.id).where(Message.recipient_id != Message.sender_id),
+    ).subquery()
+    latest = (
+        select(sides.c.user_id, sides.c.peer_id, func.max(sides.c.message_id).label('message_id'))
+        .group_by(sides.c.user_id, sides.c.peer_id)
+        .subquery()
+    )
+    rows = (
+        select(latest.c.user_id, latest.c.peer_id, Message.id, Message.sender_id, Message.body,
+               Message.created_at, literal(0))
+        .join(Message, Message.id == latest.c.message_id)
+    )
+
+    db.session.execute(conversation_table.delete())
+    result = db.session.execute(insert(conversation_table).from_select(
+        ['user_id', 'peer_id', 'last_message_id', 'last_sender_id', 'last_message_body',
+         'last_activity_at', 'unread_count'],
+        rows,
+    ))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_conversations(app):
+    """Backfill summaries when the table is new but messages already exist"""
+    with app.app_context():
+        if Conversation.query.first() is None and Message.query.first() is not None:
+            count = rebuild_conversations()
+            logger.info(f"Built {count} conversation summaries from existing messages")
+
+
+if __name__ == "__main__":
+    from app import app as flask_app
+    with flask_app.app_context():
+        print(f"Rebuilt {rebuild_conversations()} conversation summaries")
@@ -0,0 +1,226 @@
+# backend/email_outbox.py
+"""
+Persistent outbox for transactional emails
+
+Sending an email means an HTTP round-trip to Brevo, which used to happen
+inside the /auth/register and /auth/resend-code requests - registration was
+only as fast (and as available) as the email provider.
+
+Now a route only adds an EmailOutbox row in its own transaction and wakes
+the worker; the response goes out immediately. The worker, a background
+thread started by init_email_outbox():
+
+1. picks up due rows (status 'pending', next_attempt_at reached) and claims
+   each one by pushing next_attempt_at forward by a lease, so a row is sent
+   by one worker at a time, even with several processes
+2. renders the message and sends it through the shared transport
+   (email_service.get_transport(): Brevo, or EMAIL_TRANSPORT=fake offline)
+3. marks it 'sent', or schedules a retry with exponential backoff; after
+   EMAIL_MAX_ATTEMPTS failures the row is dead-lettered ('dead') and kept
+   with its last error for inspection
+
+A worker that dies mid-send leaves the row pending; it is retried once the
+lease expires. Rows still pending at shutdown are sent on the next start.
+
+Queueing a verification email marks any older one to the same address that
+is still pending as 'superseded', so a retry or a backlog can't deliver the
+old code after the new one. (An email already being sent at that moment
+still goes out.)
+
+Pending emails can also be sent once, synchronously, with:
+    python -m email_outbox
+"""
+import json
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+
+from email_service import build_verification_email, get_transport
+from models import db, EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 6))
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 300
+# How long a claimed row is reserved for the worker sending it
+LEASE_SECONDS = 60
+# Idle workers re-check the table this often (enqueue wakes them immediately)
+POLL_INTERVAL_SECONDS = 5
+BATCH_SIZE = 20
+
+# kind -> function(to_email, params) returning the message to send
+TEMPLATES = {
+    'verification': lambda to_email, params: build_verification_email(to_email, params['code']),
+}
+
+
+def enqueue_email(kind, to_email, supersede=False, **params):
+    """
+    Add an email to the outbox in the current transaction
+
+    With supersede, pending emails of the same kind to the same address are
+    marked 'superseded' and never sent. The caller commits (together with
+    whatever the email is about) and then calls notify_outbox() so the
+    worker picks it up right away.
+    """
+    if kind not in TEMPLATES:
+        raise ValueError(f"unknown email kind: {kind}")
+    if supersede:
+        EmailOutbox.query.filter_by(kind=kind, to_email=to_email, status='pending').update(
+            {EmailOutbox.status: 'superseded'}, synchronize_session=False
+        )
+    row = EmailOutbox(kind=kind, to_email=to_email, payload=json.dumps(params),
+                      status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(row)
+    return row
+
+
+def enqueue_verification_email(to_email, code):
+    # only the newest code is valid, so older unsent ones must not go out
+    return enqueue_email('verification', to_email, supersede=True, code=code)
+
+
+def backoff_delay(attempts):
+    """Seconds to wait after the given number of failed attempts (with jitter)"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class OutboxWorker:
+    def __init__(self, app, transport=None):
+        self.app = app
+        self.transport = transport or get_transport()
+        self._wake = threading.Event()
+        self._thread = None
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                processed = self.process_due()
+            except Exception as e:
+                logger.error(f"Email outbox worker error: {e}")
+                processed = 0
+            if processed < BATCH_SIZE:
+                self._wake.wait(POLL_INTERVAL_SECONDS)
+                self._wake.clear()
+
+    def process_due(self, limit=BATCH_SIZE):
+        """Send up to `limit` due emails; returns how many were attempted"""
+        with self.app.app_context():
+            now = datetime.utcnow()
+            due_ids = [
+                row_id for (row_id,) in db.session.query(EmailOutbox.id)
+                .filter(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(limit)
+                .all()
+            ]
+            attempted = 0
+            for row_id in due_ids:
+                row = self._claim(row_id)
+                if row is not None:
+                    self._deliver(row)
+                    attempted += 1
+            return attempted
+
+    def _claim(self, row_id):
+        now = datetime.utcnow()
+        claimed = EmailOutbox.query.filter(
+            EmailOutbox.id == row_id,
+            EmailOutbox.status == 'pending',
+            EmailOutbox.next_attempt_at <= now,
+        ).update({
+            EmailOutbox.next_attempt_at: now + timedelta(seconds=LEASE_SECONDS),
+            EmailOutbox.attempts: EmailOutbox.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+        # Another worker got there first
+        return db.session.get(EmailOutbox, row_id) if claimed else None
+
+    def _deliver(self, row):
+        try:
+            message = TEMPLATES[row.kind](row.to_email, json.loads(row.payload))
+            self.transport.send(message)
+        except Exception as e:
+            row.last_error = str(e)[:1000]
+            if row.attempts >= MAX_ATTEMPTS:
+                row.status = 'dead'
+                self.dead += 1
+                logger.error(f"Giving up on {row.kind} email {row.id} to {row.to_email} after {row.attempts} attempts: {e}")
+            else:
+                row.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff_delay(row.attempts))
+                self.failed += 1
+                logger.warning(f"Sending {row.kind} email {row.id} failed (attempt {row.attempts}), will retry: {e}")
+        else:
+            row.status = 'sent'
+            row.sent_at = datetime.utcnow()
+            row.last_error = None
+            self.sent += 1
+            logger.info(f"Sent {row.kind} email {row.id} to {row.to_email}")
+        db.session.commit()
+
+    def stats(self):
+        with self.app.app_context():
+            counts = dict(
+                db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id))
+                .group_by(EmailOutbox.status).all()
+            )
+        return {
+            "transport": self.transport.name,
+            "pending": counts.get('pending', 0),
+            "sent": counts.get('sent', 0),
+            "dead": counts.get('dead', 0),
+            "superseded": counts.get('superseded', 0),
+            "sent_by_this_worker": self.sent,
+            "retries_scheduled": self.failed,
+            "dead_lettered": self.dead,
+        }
+
+
+_worker = None
+
+
+def init_email_outbox(app):
+    """
+    Start the outbox worker for this process
+
+    EMAIL_OUTBOX_WORKER=0 disables it (emails then stay queued until a
+    process with a worker, or `python -m email_outbox`, sends them).
+    """
+    global _worker
+    _worker = OutboxWorker(app)
+    if os.environ.get("EMAIL_OUTBOX_WORKER", "1") != "0":
+        _worker.start()
+    return _worker
+
+
+def notify_outbox():
+    """Wake the worker after committing new outbox rows"""
+    if _worker is not None:
+        _worker.wake()
+
+
+if __name__ == "__main__":
+    from app import app as flask_app
+    worker = OutboxWorker(flask_app)
+    total = 0
+    while True:
+        attempted = worker.process_due()
+        total += attempted
+        if attempted < BATCH_SIZE:
+            break
+    print(f"Attempted {total} email(s): {worker.stats()}")
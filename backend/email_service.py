@@ -7,10 +7,16 @@ email service provider.
 
 Key Functions:
 - send_verification_email(): Sends a 4-digit code to user's email
+- build_verification_email(): Builds the Brevo message for a code
+- get_transport(): The configured transport (EMAIL_TRANSPORT=brevo or fake)
+
+Routes don't call these directly: they queue emails in the outbox
+(email_outbox.py), whose background worker sends them through get_transport().
 """
 
 import os
 import logging
+import threading
 from sib_api_v3_sdk import Configuration, ApiClient, TransactionalEmailsApi
 from sib_api_v3_sdk.rest import ApiException
 
@@ -18,6 +24,81 @@ from sib_api_v3_sdk.rest import ApiException
 logger = logging.getLogger(__name__)
 
 
+class EmailSendError(Exception):
+    """Raised by a transport when an email could not be delivered"""
+
+
+class BrevoTransport:
+    """
+    Sends messages through Brevo's transactional email API
+
+    The API client (and its HTTP connection pool) is created once and reused
+    for every send instead of being rebuilt per email.
+    """
+    name = "brevo"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+        self._email_api = None
+        self._lock = threading.Lock()
+
+    def _api(self):
+        if self._email_api is None:
+            with self._lock:
+                if self._email_api is None:
+                    api_key = self.api_key or os.environ.get('BREVO_API_KEY')
+                    if not api_key:
+                        raise EmailSendError("BREVO_API_KEY not found in environment variables")
+                    configuration = Configuration()
+                    configuration.api_key['api-key'] = api_key
+                    self._email_api = TransactionalEmailsApi(ApiClient(configuration))
+        return self._email_api
+
+    def send(self, email_message):
+        try:
+            self._api().send_transac_email(email_message)
+        except ApiException as e:
+            raise EmailSendError(f"Brevo API error: {e}") from e
+
+
+class FakeTransport:
+    """
+    Offline transport for development and tests (EMAIL_TRANSPORT=fake)
+
+    Keeps every message in `sent` and logs the verification code instead of
+    emailing it. Set `fail_next` to make the next N sends fail.
+    """
+    name = "fake"
+
+    def __init__(self):
+        self.sent = []
+        self.fail_next = 0
+        self._lock = threading.Lock()
+
+    def send(self, email_message):
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise EmailSendError("fake transport failure")
+            self.sent.append(email_message)
+        recipient = email_message["to"][0]["email"]
+        logger.info(f"[fake email] to {recipient}: {email_message['subject']}")
+
+
+_transport = None
+
+
+def get_transport():
+    """The process-wide transport selected by EMAIL_TRANSPORT (default: brevo)"""
+    global _transport
+    if _transport is None:
+        if os.environ.get('EMAIL_TRANSPORT', 'brevo').lower() == 'fake':
+            _transport = FakeTransport()
+        else:
+            _transport = BrevoTransport()
+    return _transport
+
+
 def send_verification_email(to_email, code):
     """
     Send a 4-digit verification code to user's email via Brevo API
@@ -47,20 +128,22 @@ def send_verification_email(to_email, code):
         ...     print("Email failed to send")
     """
     
-    # Get API key from environment variables (loaded from .env file)
-    api_key = os.environ.get('BREVO_API_KEY')
-    if not api_key:
-        logger.error("BREVO_API_KEY not found in environment variables")
+    try:
+        get_transport().send(build_verification_email(to_email, code))
+        logger.info(f"Verification email sent successfully to {to_email}")
+        return True
+    except EmailSendError as e:
+        # Log any errors from the Brevo API (network issues, invalid email, etc.)
+        logger.error(f"Failed to send verification email to {to_email}: {e}")
         return False
-    
-    # Configure Brevo API client with authentication credentials
-    configuration = Configuration()
-    configuration.api_key['api-key'] = api_key
-    
-    # Create API client instance for sending transactional emails
-    api_client = ApiClient(configuration)
-    email_api = TransactionalEmailsApi(api_client)
-    
+    except Exception as e:
+        # Catch any other unexpected errors
+        logger.error(f"Unexpected error sending email to {to_email}: {e}")
+        return False
+
+
+def build_verification_email(to_email, code):
+    """Brevo message (sender, recipient, subject, HTML body) carrying a verification code"""
     # Construct the email object with sender, recipient, subject, and HTML content
     # The HTML content is styled to match TechTreks branding with purple accents
     # Using a verified sender email (must be added to Brevo account)
@@ -116,18 +199,4 @@ def send_verification_email(to_email, code):
             </html>
         """
     }
-    
-    try:
-        # Send the email via Brevo API
-        # If successful, API returns response with message ID and status
-        response = email_api.send_transac_email(email_message)
-        logger.info(f"Verification email sent successfully to {to_email}")
-        return True
-    except ApiException as e:
-        # Log any errors from the Brevo API (network issues, invalid email, etc.)
-        logger.error(f"Failed to send verification email to {to_email}: {e}")
-        return False
-    except Exception as e:
-        # Catch any other unexpected errors
-        logger.error(f"Unexpected error sending email to {to_email}: {e}")
-        return False
+    return email_message
@@ -0,0 +1,214 @@
+"""
+Index advisor - checks that the app's hot queries are served by indexes
+
+Runs SQLite's EXPLAIN QUERY PLAN over the canonical queries issued by
+products/products.py, messages.py, app.py (Socket.IO), auth/login.py and
+auth/pending_sweeper.py and flags any that fall back to a full table scan or
+an extra sort step. Paginated endpoints are checked twice: the page itself
+and the count(*) that paginate() runs for the total.
+
+A full-text (virtual table) scan is fine as the outer loop of a plan, but as
+the inner loop of a join it re-runs the MATCH for every outer row - that is
+flagged like a full table scan.
+
+Usage:
+    python index_advisor.py            # print plans for every query
+    python index_advisor.py --quiet    # only print problems
+
+Exits with status 1 if any query does a full table scan (or a per-row
+full-text scan), so it can be used as a check after changing queries or
+indexes in models.py.
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import func, literal_column
+
+from app import app
+from models import db, Conversation, Message, PendingVerification, Product, ProductImage, User
+from messages import conversation_direction_query
+from products.search import apply_search
+
+
+def count_query(query):
+    """The count(*) query paginate() / keyset include_total issue for a listing query"""
+    return db.session.query(func.count(literal_column("*"))).select_from(
+        query.order_by(None).subquery()
+    )
+
+
+def canonical_queries():
+    """
+    Return (name, query) pairs mirroring the queries the routes actually run
+
+    Parameter values are placeholders - only the shape of each query matters
+    for the plan. Must be called inside an app context.
+    """
+    now = datetime.utcnow()
+    feed = Product.query.filter_by(is_public=True, status='active')
+    search, rank = apply_search(feed, 'camera')
+    seller_feed = Product.query.filter_by(user_id=1, is_public=True, status='active')
+
+    queries = [
+        # products/products.py
+        ("products: default feed",
+         feed.order_by(Product.created_at.desc(), Product.id.desc()).limit(20)),
+        ("products: category feed",
+         feed.filter_by(category='electronics')
+             .order_by(Product.created_at.desc(), Product.id.desc()).limit(20)),
+        ("products: price range sorted by price",
+         feed.filter(Product.price >= 10, Product.price <= 50)
+             .order_by(Product.price.asc(), Product.id.asc()).limit(20)),
+        ("products: keyset page after cursor",
+         feed.filter((Product.created_at < now) |
+                     ((Product.created_at == now) & (Product.id < 1000)))
+             .order_by(Product.created_at.desc(), Product.id.desc()).limit(21)),
+        ("products: feed total (page mode)", count_query(feed)),
+        ("products: category feed total (page mode)", count_query(feed.filter_by(category='electronics'))),
+        ("products: full-text search by relevance",
+         search.order_by(rank.asc(), Product.id.asc()).limit(20)),
+        ("products: full-text search sorted by date",
+         search.order_by(Product.created_at.desc(), Product.id.desc()).limit(20)),
+        ("products: full-text search total (page mode)", count_query(search)),
+        ("products: single product",
+         Product.query.filter(Product.id == 1)),
+        ("products: images for a page",
+         ProductImage.query.filter(ProductImage.product_id.in_([1, 2, 3]))),
+        ("products: seller listings",
+         seller_feed.order_by(Product.created_at.desc(), Product.id.desc()).limit(20)),
+        ("products: seller listings total (page mode)", count_query(seller_feed)),
+
+        # messages.py
+        ("messages: conversation page (one direction)",
+         conversation_direction_query(1, 2).limit(51)),
+        ("messages: conversation older page (one direction)",
+         conversation_direction_query(1, 2, before_id=100).limit(51)),
+        ("messages: conversation newer page (one direction)",
+         conversation_direction_query(1, 2, after_id=100).limit(51)),
+        ("messages: conversation list",
+         Conversation.query.filter(Conversation.user_id == 1)
+             .order_by(Conversation.last_activity_at.desc(), Conversation.id.desc()).limit(50)),
+        ("messages: conversation summary for read marker",
+         Conversation.query.filter_by(user_id=1, peer_id=2)),
+        ("messages: inbox",
+         Message.query.filter(Message.recipient_id == 1).order_by(Message.created_at.desc()).limit(50)),
+
+        # app.py (Socket.IO connect) -> delivery.recent_messages
+        ("socket: recent received messages on connect",
+         Message.query.filter(Message.recipient_id == 1).order_by(Message.id.desc()).limit(50)),
+        ("socket: recent sent messages on connect",
+         Message.query.filter(Message.sender_id == 1).order_by(Message.id.desc()).limit(50)),
+
+        # delivery.py (reconnect delta sync)
+        ("sync: newest message id for user",
+         db.session.query(func.max(Conversation.last_message_id)).filter(Conversation.user_id == 1)),
+        ("sync: received after id",
+         Message.query.filter(Message.recipient_id == 1, Message.id > 100).order_by(Message.id.asc()).limit(101)),
+        ("sync: sent after id",
+         Message.query.filter(Message.sender_id == 1, Message.id > 100).order_by(Message.id.asc()).limit(101)),
+
+        # auth/login.py
+        ("auth: user by username", User.query.filter_by(username='john.doe')),
+        ("auth: user by email", User.query.filter_by(email='john.doe@nyu.edu')),
+        ("auth: pending verification by email",
+         PendingVerification.query.filter_by(email='john.doe@nyu.edu')),
+        ("auth: pending verification by email or username",
+         PendingVerification.query.filter(
+             (PendingVerification.email == 'john.doe@nyu.edu') |
+             (PendingVerification.username == 'john.doe')
+         )),
+        ("auth: expired pending verifications (sweeper chunk)",
+         PendingVerification.query.with_entities(PendingVerification.id)
+         .filter(PendingVerification.expires_at < datetime(2025, 1, 1))
+         .order_by(PendingVerification.expires_at)
+         .limit(500)),
+    ]
+    return queries
+
+
+def explain(query):
+    """Return the EXPLAIN QUERY PLAN rows (id, parent, notused, detail) for an ORM query"""
+    # chat tables may live in their own database ('messages' bind)
+    engine = db.session.get_bind(clause=query.statement)
+    compiled = query.statement.compile(
+        dialect=engine.dialect,
+        compile_kwargs={"render_postcompile": True}  # expand IN (...) lists
+    )
+    params = []
+    for name in compiled.positiontup:
+        value = compiled.params[name]
+        # EXPLAIN doesn't need real values, just ones sqlite3 can bind
+        if isinstance(value, datetime):
+            value = value.isoformat(sep=' ')
+        params.append(value)
+
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", tuple(params)).fetchall()
+
+
+def find_problems(plan):
+    """
+    Classify plan rows
+
+    Returns (full_scans, sorts) as lists of detail lines: tables scanned
+    without an index - including a virtual table scanned as the inner loop
+    of a join, i.e. once per outer row - and rows sorted in a temporary
+    b-tree because no index provides the requested order.
+    """
+    # Scans of a materialized CTE / subquery read its (already filtered) result
+    materialized = {
+        detail.split()[1] for _, _, _, detail in plan
+        if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))
+    }
+    full_scans = []
+    loops = {}  # parent id -> number of table loops seen so far at that level
+    for _, parent, _, detail in plan:
+        if not detail.startswith(("SCAN", "SEARCH")):
+            continue
+        is_inner = loops.get(parent, 0) > 0
+        loops[parent] = loops.get(parent, 0) + 1
+        if not detail.startswith("SCAN") or "USING" in detail:
+            continue
+        if "VIRTUAL TABLE" in detail:
+            if is_inner:
+                full_scans.append(detail)
+        elif detail.split()[1] not in materialized:
+            full_scans.append(detail)
+    sorts = [detail for _, _, _, detail in plan if "TEMP B-TREE" in detail]
+    return full_scans, sorts
+
+
+def main(argv):
+    quiet = "--quiet" in argv
+
+    with app.app_context():
+        if db.engine.dialect.name != "sqlite":
+            print(f"index advisor only supports SQLite (database is {db.engine.dialect.name})")
+            return 2
+
+        scan_count = 0
+        for name, query in canonical_queries():
+            plan = explain(query)
+            full_scans, sorts = find_problems(plan)
+            plan = [detail for _, _, _, detail in plan]
+            scan_count += len(full_scans)
+
+            if quiet and not full_scans and not sorts:
+                continue
+
+            status = "FULL SCAN" if full_scans else ("SORT" if sorts else "ok")
+            print(f"[{status:>9}] {name}")
+            for line in plan:
+                marker = "  !! " if line in full_scans or line in sorts else "     "
+                print(f"{marker}{line}")
+
+        if scan_count:
+            print(f"\n{scan_count} full table scan(s) found - consider adding an index in models.py")
+            return 1
+
+        print("\nAll canonical queries use indexes")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
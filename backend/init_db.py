@@ -1,6 +1,65 @@
-from app import app, db
-from models import User
+"""
+Database setup and bulk seeding
+
+    python init_db.py                       # create the tables
+    python init_db.py seed                  # 100k users, 1M products, 10M messages
+    python init_db.py seed --users 5000 --products 50000 --messages 500000 --seed 7
+    python init_db.py seed --reset          # drop everything first
+
+The seeder generates a production-sized dataset for profiling the hot paths
+in products.py and messages.py. It is deterministic: the same arguments
+(and --seed) always produce the same rows. Activity is skewed like the real
+site - a few power sellers own most listings and a few conversations carry
+most messages (Zipf-distributed) - rather than spread evenly.
+
+To finish in minutes it:
+- inserts rows with batched Core INSERTs (no ORM objects, no per-row events)
+- drops each table's secondary indexes during the load and builds them once
+  afterwards, and does the same for the product full-text index
+- hashes the shared password once
+- stores a small pool of placeholder photos (with their resized variants)
+  that every listing's images point at
+- rebuilds the inbox summaries once from the message table
+
+Every seeded user can log in as user<N> / SEED_PASSWORD.
+"""
+import argparse
+import hashlib
+import io
 import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from sqlalchemy import text
+
+from app import app, db
+from auth.passwords import hash_password
+from conversations import rebuild_conversations
+from models import Message, Product, ProductImage, UploadBlob, User
+from products.images import VARIANTS, VARIANT_EXTENSION, Image, render_variant
+from products.search import init_product_search
+from products.storage import blob_path, blob_url, upload_dir
+
+SEED_PASSWORD = "SeedPass123!"
+BATCH_SIZE = 10000
+# Weight of the k-th most active user / conversation is 1 / k^ZIPF_EXPONENT
+ZIPF_EXPONENT = 1.0
+# Conversations per user, on average
+CONVERSATIONS_PER_USER = 5
+# Distinct placeholder photos shared by all listings
+IMAGE_POOL_SIZE = 32
+
+CATEGORIES = ["textbooks", "electronics", "furniture", "clothing", "kitchen", "sports", "tickets", "other"]
+CONDITIONS = ["new", "like-new", "good", "fair", "poor"]
+WORDS = [
+    "calculus", "chemistry", "laptop", "monitor", "desk", "lamp", "chair", "jacket",
+    "sneakers", "blender", "kettle", "bike", "helmet", "guitar", "camera", "headphones",
+    "textbook", "notebook", "charger", "backpack", "mattress", "rug", "poster", "printer",
+]
+SEED_START = datetime(2025, 1, 1)
 
 
 # ran only once to initialize the database
@@ -9,7 +68,7 @@ def init_db():
         # Create all tables
         db.create_all()
         print("Database initialized successfully!")
-        
+
         # Verify User table
         try:
             user_count = User.query.count()
@@ -18,5 +77,258 @@ def init_db():
             print("Database tables created successfully!")
 
 
+def zipf_cum_weights(n, exponent=ZIPF_EXPONENT):
+    """Cumulative weights for random.choices: item k gets weight 1 / (k+1)^exponent"""
+    return list(accumulate(1 / (k + 1) ** exponent for k in range(n)))
+
+
+def insert_batches(table, rows, label=None, total=None):
+    """Insert an iterable of row dicts BATCH_SIZE at a time, one transaction per batch"""
+    started = time.perf_counter()
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+            if label and count % (BATCH_SIZE * 50) == 0:
+                print(f"  {label}: {count}/{total} ({count / (time.perf_counter() - started):.0f} rows/s)")
+    if batch:
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+        count += len(batch)
+    if label:
+        print(f"  {label}: {count} rows in {time.perf_counter() - started:.1f}s")
+    return count
+
+
+@contextmanager
+def deferred_indexes(table, label=None):
+    """
+    Drop a table's secondary indexes during a bulk load and build them once afterwards
+
+    Building an index from the finished table is a single sort; maintaining
+    it row by row turns every insert into random B-tree writes, which gets
+    slower as the table grows.
+    """
+    db.session.commit()
+    engine = db.engines[table.metadata.info.get("bind_key")]
+    indexes = list(table.indexes)
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+    try:
+        yield
+    finally:
+        db.session.commit()
+        started = time.perf_counter()
+        for index in indexes:
+            index.create(engine, checkfirst=True)
+        if label:
+            print(f"  {label} indexes: {len(indexes)} built in {time.perf_counter() - started:.1f}s")
+
+
+def placeholder_photos(rng, with_files=True):
+    """
+    The shared photo pool: (content_hash, original_url, {variant: url}, size) per photo
+
+    With with_files (and Pillow installed) the JPEGs and their WebP variants
+    are written to the upload folder at their content addresses, exactly as
+    uploads and the image pipeline would; otherwise the rows only carry URLs.
+    """
+    if not with_files or Image is None:
+        return [
+            (None, f"/products/uploads/seed/photo-{k}.jpg",
+             {name: f"/products/uploads/seed/photo-{k}_{name}.{VARIANT_EXTENSION}" for name in VARIANTS}, 0)
+            for k in range(IMAGE_POOL_SIZE)
+        ]
+
+    directory = upload_dir(app)
+    photos = []
+    for k in range(IMAGE_POOL_SIZE):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        accent = tuple(rng.randrange(256) for _ in range(3))
+        photo = Image.new("RGB", (1600, 1200), color)
+        photo.paste(accent, (rng.randrange(200, 600), rng.randrange(200, 400), rng.randrange(900, 1400), rng.randrange(700, 1000)))
+        buffer = io.BytesIO()
+        photo.save(buffer, "JPEG", quality=85)
+        data = buffer.getvalue()
+
+        content_hash = hashlib.sha256(data).hexdigest()
+        relative_path = blob_path(content_hash, "jpg")
+        path = os.path.join(directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        # Same file names products/images.py gives the variants
+        stem = os.path.splitext(relative_path)[0]
+        variants = {}
+        for name, max_edge in VARIANTS.items():
+            variant_path = f"{stem}_{name}.{VARIANT_EXTENSION}"
+            render_variant(photo, max_edge, os.path.join(directory, variant_path))
+            variants[name] = blob_url(variant_path)
+        photos.append((content_hash, blob_url(relative_path), variants, len(data)))
+    return photos
+
+
+def _suspend_search_trigger():
+    # Indexing 1M rows one trigger call at a time is far slower than one rebuild
+    if app.extensions.get("product_search"):
+        db.session.execute(text("DROP TRIGGER IF EXISTS product_fts_ai"))
+        db.session.commit()
+
+
+def _rebuild_search_index():
+    if app.extensions.get("product_search"):
+        db.session.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+        db.session.commit()
+        # recreates the trigger dropped by _suspend_search_trigger
+        init_product_search(app)
+
+
+def seed_database(users=100000, products=1000000, messages=10000000, seed=42, with_image_files=True, quiet=False):
+    """
+    Fill an empty database with generated users, products, images and messages
+
+    Must run inside an app context. Each table draws from its own random
+    stream, so changing one volume doesn't reshuffle the others. Returns a
+    summary including the busiest conversation pairs, for building workloads.
+    """
+    log = (lambda *a: None) if quiet else print
+    if db.session.query(User.id).first() is not None:
+        raise RuntimeError("database already has users - seed an empty database (or use --reset)")
+    started = time.perf_counter()
+    user_ids = range(1, users + 1)
+    user_weights = zipf_cum_weights(users)
+
+    # One hash for everyone: hashing 100k passwords would take longer than the rest
+    password_hash = hash_password(SEED_PASSWORD)
+    insert_batches(User.__table__, (
+        {"id": i, "username": f"user{i}", "email": f"user{i}@nyu.edu", "password_hash": password_hash}
+        for i in user_ids
+    ), None if quiet else "users", users)
+
+    rng = random.Random(f"{seed}-products")
+
+    def product_rows():
+        for i in range(1, products + 1):
+            created = SEED_START + timedelta(seconds=30 * i)
+            yield {
+                "id": i,
+                "user_id": rng.choices(user_ids, cum_weights=user_weights)[0],
+                "title": " ".join(rng.sample(WORDS, 3)).title(),
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "price": round(rng.uniform(1, 500), 2),
+                "category": rng.choice(CATEGORIES),
+                "condition": rng.choice(CONDITIONS),
+                "quantity": 1,
+                "status": "active" if rng.random() < 0.85 else rng.choice(["sold", "reserved"]),
+                "is_public": rng.random() < 0.95,
+                "created_at": created,
+                "updated_at": created,
+            }
+    label = None if quiet else "products"
+    _suspend_search_trigger()
+    try:
+        with deferred_indexes(Product.__table__, label):
+            insert_batches(Product.__table__, product_rows(), label, products)
+    finally:
+        _rebuild_search_index()
+
+    rng = random.Random(f"{seed}-images")
+    photos = placeholder_photos(rng, with_image_files)
+    references = {}
+
+    def image_rows():
+        for product_id in range(1, products + 1):
+            for n in range(rng.randint(1, 3)):
+                content_hash, url, variants, _ = rng.choice(photos)
+                if content_hash:
+                    references[content_hash] = references.get(content_hash, 0) + 1
+                yield {
+                    "product_id": product_id,
+                    "url": url,
+                    "content_hash": content_hash,
+                    "is_primary": n == 0,
+                    "created_at": SEED_START,
+                    "thumb_url": variants["thumb"],
+                    "card_url": variants["card"],
+                    "detail_url": variants["detail"],
+                }
+    label = None if quiet else "images"
+    with deferred_indexes(ProductImage.__table__, label):
+        insert_batches(ProductImage.__table__, image_rows(), label, products * 2)
+    insert_batches(UploadBlob.__table__, (
+        {"content_hash": content_hash, "path": url[len("/products/uploads/"):], "size": size,
+         "ref_count": references[content_hash], "created_at": SEED_START}
+        for content_hash, url, _, size in photos if content_hash in references
+    ))
+
+    # A fixed set of conversations; the popular ones carry most of the messages
+    rng = random.Random(f"{seed}-messages")
+    pairs = set()
+    while len(pairs) < min(users * CONVERSATIONS_PER_USER, users * (users - 1) // 2):
+        a, b = rng.choices(user_ids, cum_weights=user_weights, k=2)
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+    pairs = sorted(pairs)
+    rng.shuffle(pairs)
+    pair_weights = zipf_cum_weights(len(pairs))
+
+    def message_rows():
+        for i in range(1, messages + 1):
+            a, b = rng.choices(pairs, cum_weights=pair_weights)[0]
+            if rng.random() < 0.5:
+                a, b = b, a
+            yield {
+                "id": i,
+                "sender_id": a,
+                "recipient_id": b,
+                "body": " ".join(rng.choices(WORDS, k=rng.randint(2, 10))),
+                "created_at": SEED_START + timedelta(seconds=3 * i),
+            }
+    label = None if quiet else "messages"
+    with deferred_indexes(Message.__table__, label):
+        insert_batches(Message.__table__, message_rows(), label, messages)
+
+    # Core inserts bypass the event that maintains the inbox summaries
+    summary_started = time.perf_counter()
+    conversations = rebuild_conversations()
+    log(f"  conversations: {conversations} rows in {time.perf_counter() - summary_started:.1f}s")
+    log(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    return {"users": users, "products": products, "messages": messages, "pairs": pairs[:100]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command")
+    seed_parser = commands.add_parser("seed", help="fill the database with generated data")
+    seed_parser.add_argument("--users", type=int, default=100000)
+    seed_parser.add_argument("--products", type=int, default=1000000)
+    seed_parser.add_argument("--messages", type=int, default=10000000)
+    seed_parser.add_argument("--seed", type=int, default=42, help="random seed")
+    seed_parser.add_argument("--reset", action="store_true", help="drop and recreate all tables first")
+    seed_parser.add_argument("--no-image-files", action="store_true",
+                             help="don't write placeholder photos to the upload folder")
+    args = parser.parse_args()
+
+    if args.command != "seed":
+        init_db()
+        return
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+            init_product_search(app)
+        try:
+            seed_database(args.users, args.products, args.messages, args.seed,
+                          with_image_files=not args.no_image_files)
+        except RuntimeError as e:
+            parser.exit(1, f"{e}\n")
+
+
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    main()
@@ -0,0 +1,177 @@
+# backend/message_writer.py
+"""
+Group-commit writer for chat messages sent over Socket.IO
+
+Committing every chat message on its own makes SQLite fsync once per message,
+and all writers queue up behind that one file lock - chat throughput is capped
+by the disk's fsync rate no matter how many clients are sending.
+
+MessageWriter puts a queue in front of the database instead. A single
+background task takes the first queued message, keeps collecting whatever
+else arrives within `max_delay` seconds (up to `max_batch` messages) and
+inserts the whole batch in one transaction - one fsync for the lot. Only
+once that commit has succeeded is `new_message` emitted for each message,
+so clients never see a message that could still be lost.
+
+The queue and background task come from the Socket.IO server, so they are
+greenlets under gevent and threads in threading mode.
+
+The queue is bounded (max_queued). If the database falls behind and the
+queue fills up, submit() raises MessageWriterBusy instead of letting memory
+grow without limit and every message's delivery lag with it; the send
+handler tells the sender the message was not accepted, so it can be retried.
+"""
+import logging
+import queue
+import threading
+import time
+
+from models import db, Message
+from usernames import resolve_usernames
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriterBusy(Exception):
+    """The queue is full; the message was not accepted and should be retried later"""
+
+
+class MessageWriter:
+    def __init__(self, socketio, app, max_batch=100, max_delay=0.005, max_queued=10000):
+        self.socketio = socketio
+        self.app = app
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queued = max_queued
+        self._queue = None
+        self._start_lock = threading.Lock()
+
+        # stats (exposed at GET /api/messages/writer/stats)
+        self.batches = 0
+        self.messages = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_batch_seen = 0
+        self.total_commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.last_commit_seconds = 0.0
+
+    def submit(self, sender_id, recipient_id, body, client_id=None):
+        """
+        Queue a message for the next batch (returns immediately)
+
+        Raises MessageWriterBusy if max_queued messages are already waiting.
+        """
+        self._ensure_started()
+        try:
+            self._queue.put_nowait({
+                "sender_id": sender_id,
+                "recipient_id": recipient_id,
+                "body": body,
+                "client_id": client_id,
+            })
+        except queue.Full:  # gevent's queue raises the stdlib exception too
+            self.rejected += 1
+            raise MessageWriterBusy("message queue is full")
+
+    def _ensure_started(self):
+        if self._queue is not None:
+            return
+        with self._start_lock:
+            if self._queue is None:
+                pending = self.socketio.server.eio.create_queue(maxsize=self.max_queued)
+                self.socketio.start_background_task(self._run, pending)
+                self._queue = pending
+
+    def _run(self, pending):
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.max_delay
+            # Coalesce whatever else arrives within the window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:  # gevent's queue raises the stdlib exception too
+                    break
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logger.error(f"Message writer failed on a batch of {len(batch)}: {e}")
+
+    def flush(self, batch):
+        """Insert a batch in one transaction, then emit each message"""
+        with self.app.app_context():
+            started = time.monotonic()
+            try:
+                messages = self._commit(batch)
+            except Exception as e:
+                db.session.rollback()
+                # One bad message (e.g. unknown recipient) shouldn't drop the rest
+                logger.warning(f"Batch commit of {len(batch)} messages failed ({e}), retrying one by one")
+                messages = []
+                for item in batch:
+                    try:
+                        messages.extend(self._commit([item]))
+                    except Exception as item_error:
+                        db.session.rollback()
+                        self.failed += 1
+                        logger.error(f"Dropping message from {item['sender_id']} to {item['recipient_id']}: {item_error}")
+            elapsed = time.monotonic() - started
+            self._record(len(messages), elapsed)
+            self._emit(messages)
+
+    def _commit(self, batch):
+        messages = [
+            (Message(sender_id=item["sender_id"], recipient_id=item["recipient_id"], body=item["body"]), item)
+            for item in batch
+        ]
+        db.session.add_all([m for m, _ in messages])
+        db.session.commit()
+        return messages
+
+    def _emit(self, messages):
+        names = resolve_usernames(
+            user_id for m, _ in messages for user_id in (m.sender_id, m.recipient_id)
+        )
+        for m, item in messages:
+            out = m.to_dict()
+            # add readable usernames so clients can detect "mine" reliably
+            out["sender_username"] = names.get(m.sender_id)
+            out["recipient_username"] = names.get(m.recipient_id)
+            # echo back client_id so the client can reconcile its optimistic message
+            if item["client_id"]:
+                out["client_id"] = item["client_id"]
+            self.socketio.emit("new_message", out, room=f"user_{m.recipient_id}")
+            if m.sender_id != m.recipient_id:
+                self.socketio.emit("new_message", out, room=f"user_{m.sender_id}")
+
+    def _record(self, size, elapsed):
+        if not size:
+            return
+        self.batches += 1
+        self.messages += size
+        self.max_batch_seen = max(self.max_batch_seen, size)
+        self.last_commit_seconds = elapsed
+        self.total_commit_seconds += elapsed
+        self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+        logger.info(f"Persisted batch of {size} message(s) in {elapsed * 1000:.1f} ms")
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "messages": self.messages,
+            "failed": self.failed,
+            "avg_batch_size": round(self.messages / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "avg_commit_ms": round(self.total_commit_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+            "max_commit_ms": round(self.max_commit_seconds * 1000, 3),
+            "last_commit_ms": round(self.last_commit_seconds * 1000, 3),
+            "max_batch": self.max_batch,
+            "max_delay_ms": self.max_delay * 1000,
+        }
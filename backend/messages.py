@@ -1,22 +1,79 @@
 # backend/messages.py
-from flask import Blueprint, request, jsonify, session
-from models import db, Message, User
+from flask import Blueprint, request, jsonify
+from auth.identity import current_user_id
+from models import db, Message
+from conversations import list_conversations, mark_read
+from usernames import message_payloads, resolve_user_id, resolve_usernames
 
 messages_bp = Blueprint("messages", __name__)
 
+# GET /api/messages page size (?limit= can ask for up to MAX_PAGE_SIZE)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
 def resolve_user_param(val):
-    if val is None:
+    # id or username -> id (username lookups are cached, see usernames.py)
+    return resolve_user_id(val)
+
+def _int_arg(name):
+    val = request.args.get(name)
+    if val in (None, ""):
         return None
-    # if it's already an integer string, convert
-    try:
-        return int(val)
-    except (ValueError, TypeError):
-        # otherwise treat as username and look up id
-        u = User.query.filter_by(username=val).first()
-        return u.id if u else None
+    return int(val)
+
+def conversation_direction_query(sender, recipient, before_id=None, after_id=None):
+    """
+    Messages sent one way within a conversation, in page order
+
+    Newest first (optionally only ids below before_id), or oldest first when
+    after_id is given. Served by ix_message_pair_id as a bounded range scan.
+    """
+    q = Message.query.filter(Message.sender_id == sender, Message.recipient_id == recipient)
+    if after_id is not None:
+        return q.filter(Message.id > after_id).order_by(Message.id.asc())
+    if before_id is not None:
+        q = q.filter(Message.id < before_id)
+    return q.order_by(Message.id.desc())
+
+def conversation_page(u1, u2, before_id=None, after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of the conversation between u1 and u2, in chronological order
+
+    - no cursor: the latest `limit` messages
+    - before_id: the `limit` messages just older than that message
+    - after_id: the `limit` messages just newer than that message
+
+    Each direction (u1 -> u2, u2 -> u1) is fetched separately with LIMIT
+    limit + 1 and the two are merged here, so the cost depends on the page
+    size and not on how long the conversation is. Returns (messages, has_more)
+    where has_more says whether further messages exist past this page.
+    """
+    rows = conversation_direction_query(u1, u2, before_id, after_id).limit(limit + 1).all()
+    if u1 != u2:
+        rows += conversation_direction_query(u2, u1, before_id, after_id).limit(limit + 1).all()
+    rows.sort(key=lambda m: m.id, reverse=after_id is None)
+    has_more = len(rows) > limit
+    page = sorted(rows[:limit], key=lambda m: m.id)
+    return page, has_more
 
 @messages_bp.route("/messages", methods=["GET"])
 def get_messages():
+    """
+    Conversation history between user1 and user2, one page at a time
+
+    Query params: user1, user2 (id or username), limit, and at most one of
+    before_id (load older history) / after_id (fetch newer messages).
+
+    Response:
+        {
+            "messages": [...],      # oldest first
+            "has_more": true,       # more messages beyond this page (older for
+                                    # before_id / no cursor, newer for after_id)
+            "before_id": 120,       # pass as before_id to load older messages
+            "after_id": 169,        # pass as after_id to fetch newer messages
+            "page_size": 50
+        }
+    """
     raw_u1 = request.args.get("user1")
     raw_u2 = request.args.get("user2")
     u1 = resolve_user_param(raw_u1)
@@ -25,16 +82,29 @@ def get_messages():
     if not u1 or not u2:
         return jsonify({"error": "user1 and user2 required (id or username)"}), 400
 
-    msgs = Message.query.filter(
-        ((Message.sender_id == u1) & (Message.recipient_id == u2)) |
-        ((Message.sender_id == u2) & (Message.recipient_id == u1))
-    ).order_by(Message.created_at.asc()).all()
-    return jsonify([m.to_dict() for m in msgs])
+    try:
+        before_id = _int_arg("before_id")
+        after_id = _int_arg("after_id")
+        limit = _int_arg("limit") or DEFAULT_PAGE_SIZE
+    except ValueError:
+        return jsonify({"error": "before_id, after_id and limit must be integers"}), 400
+    if before_id is not None and after_id is not None:
+        return jsonify({"error": "use either before_id or after_id, not both"}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    msgs, has_more = conversation_page(u1, u2, before_id=before_id, after_id=after_id, limit=limit)
+    return jsonify({
+        "messages": [m.to_dict() for m in msgs],
+        "has_more": has_more,
+        "before_id": msgs[0].id if msgs else before_id,
+        "after_id": msgs[-1].id if msgs else after_id,
+        "page_size": limit,
+    })
 
 @messages_bp.route("/messages", methods=["POST"])
 def send_message():
     data = request.get_json() or {}
-    sender = data.get("sender_id") or session.get("user_id")
+    sender = data.get("sender_id") or current_user_id()
     recipient = data.get("recipient_id")
     body = data.get("body", "").strip()
     if not sender or not recipient or not body:
@@ -46,24 +116,109 @@ def send_message():
 
 @messages_bp.route("/messages/inbox", methods=["GET"])
 def get_inbox():
+    """
+    Deprecated: use GET /api/messages/conversations
+
+    The newest messages received by a user (at most ?limit=, default
+    DEFAULT_PAGE_SIZE). It used to return every message ever received.
+    """
     # Accepts 'recipient' (id or username) or 'recipient_username' / 'user'
     raw = request.args.get("recipient") or request.args.get("recipient_username") or request.args.get("user")
     if raw is None:
         return jsonify({"error": "recipient query param required (id or username)"}), 400
+    try:
+        limit = _int_arg("limit") or DEFAULT_PAGE_SIZE
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
 
     # resolve_user_param already converts username -> id
     rid = resolve_user_param(raw)
     if not rid:
         return jsonify({"error": "recipient not found"}), 404
 
-    # fetch messages where recipient == rid (newest first)
-    msgs = Message.query.filter(Message.recipient_id == rid).order_by(Message.created_at.desc()).all()
+    # newest first, bounded range scan on ix_message_recipient_created
+    msgs = (
+        Message.query.filter(Message.recipient_id == rid)
+        .order_by(Message.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+    # include sender_username for convenience (resolved in one batched query)
+    response = jsonify(message_payloads(msgs, fields=('sender',)))
+    response.headers["Deprecation"] = "true"
+    response.headers["Link"] = '</api/messages/conversations>; rel="successor-version"'
+    return response
+
+def _own_user(requested):
+    """
+    (logged-in user id, None), or (None, error response)
+
+    Conversation summaries are private: a `requested` user (id or username)
+    other than the session's is refused rather than looked up.
+    """
+    uid = current_user_id()
+    if not uid:
+        return None, (jsonify({"error": "authentication required"}), 401)
+    if requested not in (None, "") and resolve_user_param(requested) != uid:
+        return None, (jsonify({"error": "permission denied"}), 403)
+    return uid, None
+
+@messages_bp.route("/messages/conversations", methods=["GET"])
+def get_conversations():
+    """
+    The user's conversations, most recent first, with unread counts
 
-    # include sender_username for convenience
+    Reads the maintained Conversation rows (one per peer), so the cost grows
+    with the number of conversations shown, not with the number of messages.
+    Login required. Query params: limit, user (optional; must be the
+    logged-in user).
+    """
+    uid, error = _own_user(request.args.get("user"))
+    if error:
+        return error
+    try:
+        limit = _int_arg("limit") or DEFAULT_PAGE_SIZE
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conversations = list_conversations(uid, limit=limit)
+    names = resolve_usernames(c.peer_id for c in conversations)
     out = []
-    for m in msgs:
-        d = m.to_dict()
-        s = User.query.get(m.sender_id)
-        d["sender_username"] = s.username if s else None
+    for c in conversations:
+        d = c.to_dict()
+        d["peer_username"] = names.get(c.peer_id)
         out.append(d)
-    return jsonify(out)
\ No newline at end of file
+    return jsonify({
+        "conversations": out,
+        "unread_total": sum(c.unread_count for c in conversations),
+    })
+
+@messages_bp.route("/messages/read", methods=["POST"])
+def mark_conversation_read():
+    """
+    Mark a conversation as read
+
+    Login required. Body: { "peer": id or username, "up_to_id": optional
+    message id, "user_id": optional, must be the logged-in user }
+    """
+    data = request.get_json() or {}
+    uid, error = _own_user(data.get("user_id"))
+    if error:
+        return error
+    peer = resolve_user_param(data.get("peer"))
+    if not peer:
+        return jsonify({"error": "peer required"}), 400
+    up_to_id = data.get("up_to_id")
+    if up_to_id is not None:
+        try:
+            up_to_id = int(up_to_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "up_to_id must be an integer"}), 400
+
+    conversation = mark_read(uid, peer, up_to_id)
+    if conversation is None:
+        return jsonify({"error": "conversation not found"}), 404
+    return jsonify(conversation.to_dict())
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime, timedelta
+import logging
 
 # create db instance 
 db = SQLAlchemy()
@@ -27,12 +28,20 @@ class PendingVerification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
     username = db.Column(db.String(80), nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)  # scrypt hashes are ~160 chars
     code = db.Column(db.String(4), nullable=False)  # 4-digit verification code
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)  # Code expires after 10 minutes
     attempts = db.Column(db.Integer, default=0, nullable=False)  # Failed verification attempts
     
+    __table_args__ = (
+        # verify_email / resend_code look up by email, register by email OR username
+        db.Index('ix_pending_verification_email', 'email'),
+        db.Index('ix_pending_verification_username', 'username'),
+        # the background sweeper deletes by expiry (auth/pending_sweeper.py)
+        db.Index('ix_pending_verification_expires_at', 'expires_at'),
+    )
+    
     def __repr__(self):
         return f'<PendingVerification {self.email}>'
     
@@ -46,10 +55,48 @@ class PendingVerification(db.Model):
         db.session.commit()
 
 
+class EmailOutbox(db.Model):
+    """
+    Email waiting to be sent by the outbox worker (see email_outbox.py)
+
+    Rows are written in the same transaction as the data the email is about
+    (e.g. a PendingVerification), so an email is never lost or sent for a
+    registration that was rolled back.
+
+    Attributes:
+        kind: Which template to render ('verification')
+        to_email: Recipient address
+        payload: JSON parameters for the template (e.g. the code)
+        status: 'pending', 'sent', 'dead' (gave up after max attempts) or
+            'superseded' (replaced by a newer email before it was sent)
+        attempts: Send attempts so far
+        next_attempt_at: When the worker may (re)try; pushed forward while a
+            worker holds the row and after each failure (backoff)
+        last_error: Error from the latest failed attempt
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    to_email = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # The worker's poll: pending emails that are due
+        db.Index('ix_email_outbox_status_due', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.kind} {self.status}>'
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(256), nullable=False)  # scrypt hashes are ~160 chars
     email = db.Column(db.String(120), unique=True, nullable=False)
     
     # Relationship to products
@@ -59,12 +106,29 @@ class User(db.Model):
         return f'<User {self.username}>'
 
 class Message(db.Model):
+    # Chat tables live in the 'messages' bind (see database.py) so chat writes
+    # can be given their own database. No foreign keys to user: the two may
+    # be different databases.
+    __bind_key__ = 'messages'
+
     id = db.Column(db.Integer, primary_key=True)
-    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    recipient_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    sender_id = db.Column(db.Integer, nullable=False)
+    recipient_id = db.Column(db.Integer, nullable=False)
     body = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    __table_args__ = (
+        # Conversation between two users (GET /api/messages), paged by id
+        # (ids grow with created_at). Also serves "messages sent by X"
+        # through its leftmost column.
+        db.Index('ix_message_pair_id', 'sender_id', 'recipient_id', 'id'),
+        # Inbox and socket connect: messages received by X, newest first
+        db.Index('ix_message_recipient_created', 'recipient_id', 'created_at'),
+        # Reconnect delta sync: messages received / sent by X after a given id
+        db.Index('ix_message_recipient_id', 'recipient_id', 'id'),
+        db.Index('ix_message_sender_id', 'sender_id', 'id'),
+    )
+
     def to_dict(self):
         return {
             "id": self.id,
@@ -75,6 +139,70 @@ class Message(db.Model):
         }
 
 
+class Conversation(db.Model):
+    """
+    One user's view of a conversation with one peer (the inbox row)
+
+    Every message keeps two rows current - the sender's and the recipient's -
+    so the inbox is a single read of the user's rows, newest first, instead
+    of a scan over every message they ever received. Maintained by
+    conversations.py when a Message is inserted.
+
+    Attributes:
+        user_id: Owner of this inbox row
+        peer_id: The other participant
+        last_message_id / last_sender_id / last_message_body: Latest message, for the preview
+        last_activity_at: When the latest message was sent
+        unread_count: Messages from peer_id the user hasn't read yet
+        last_read_message_id: Newest message the user has marked as read
+    """
+    __bind_key__ = 'messages'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    peer_id = db.Column(db.Integer, nullable=False)
+    last_message_id = db.Column(db.Integer, nullable=False)
+    last_sender_id = db.Column(db.Integer, nullable=False)
+    last_message_body = db.Column(db.Text, nullable=False)
+    last_activity_at = db.Column(db.DateTime, nullable=False)
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    last_read_message_id = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'peer_id', name='uq_conversation_user_peer'),
+        # GET /api/messages/conversations: a user's conversations, most recent first
+        db.Index('ix_conversation_user_activity', 'user_id', 'last_activity_at'),
+    )
+
+    def to_dict(self):
+        return {
+            "peer_id": self.peer_id,
+            "unread_count": self.unread_count,
+            "last_read_message_id": self.last_read_message_id,
+            "last_activity_at": self.last_activity_at.isoformat(),
+            "last_message": {
+                "id": self.last_message_id,
+                "sender_id": self.last_sender_id,
+                "body": self.last_message_body,
+                "created_at": self.last_activity_at.isoformat(),
+            },
+        }
+
+
+class DeliveryWatermark(db.Model):
+    """
+    Newest message id a user's client has acknowledged over Socket.IO
+
+    Lets a reconnecting client that doesn't send its own last-seen id receive
+    only the messages it missed (see delivery.py).
+    """
+    __bind_key__ = 'messages'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    message_id = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -92,8 +220,23 @@ class Product(db.Model):
     # Relationship to images
     images = db.relationship('ProductImage', backref='product', lazy=True, cascade='all, delete-orphan')
 
-    def to_dict(self, include_seller=False, include_images=False):
-        """Serialize product to dictionary"""
+    # Every public feed filters on is_public + status first, then either sorts by
+    # time, narrows by category, or sorts/filters by price. id is the keyset tie-breaker.
+    __table_args__ = (
+        db.Index('ix_product_feed', 'is_public', 'status', 'created_at', 'id'),
+        db.Index('ix_product_category_feed', 'is_public', 'status', 'category', 'created_at', 'id'),
+        db.Index('ix_product_price_feed', 'is_public', 'status', 'price', 'id'),
+        # Seller profile listings (GET /products/user/<id>); visitors only see
+        # public + active listings, the owner sees all of theirs
+        db.Index('ix_product_user_feed', 'user_id', 'is_public', 'status', 'created_at', 'id'),
+    )
+
+    def to_dict(self, include_seller=False, include_images=False, image_variant='card'):
+        """
+        Serialize product to dictionary
+        image_variant picks the image size for thumbnail_url / images[].url:
+        'thumb', 'card' (grid, default) or 'detail' (product page)
+        """
         data = {
             'id': self.id,
             'user_id': self.user_id,
@@ -116,12 +259,12 @@ class Product(db.Model):
             }
         
         if include_images:
-            data['images'] = [img.to_dict() for img in self.images]
+            data['images'] = [img.to_dict(variant=image_variant) for img in self.images]
             # Add thumbnail URL (primary image or first image)
             primary_img = next((img for img in self.images if img.is_primary), None)
             if not primary_img and self.images:
                 primary_img = self.images[0]
-            data['thumbnail_url'] = primary_img.url if primary_img else None
+            data['thumbnail_url'] = primary_img.variant_url(image_variant) if primary_img else None
         
         return data
 
@@ -131,17 +274,35 @@ class Product(db.Model):
 
 class ProductImage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
-    url = db.Column(db.String(500), nullable=False)
+    # indexed: list pages load all images for a page with product_id IN (...)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)
+    url = db.Column(db.String(500), nullable=False)  # original upload
+    # sha256 of the uploaded bytes - identical uploads share one UploadBlob/file
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
     is_primary = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    def to_dict(self):
-        """Serialize image to dictionary"""
+    # Resized, metadata-free WebP variants (filled in by products/images.py)
+    thumb_url = db.Column(db.String(500), nullable=True)
+    card_url = db.Column(db.String(500), nullable=True)
+    detail_url = db.Column(db.String(500), nullable=True)
+
+    def variant_url(self, variant):
+        """URL of the requested variant, or the original if it hasn't been generated yet"""
+        return getattr(self, f'{variant}_url', None) or self.url
+
+    def to_dict(self, variant='detail'):
+        """Serialize image to dictionary, with url pointing at the requested variant"""
         return {
             'id': self.id,
             'product_id': self.product_id,
-            'url': self.url,
+            'url': self.variant_url(variant),
+            'original_url': self.url,
+            'variants': {
+                'thumb': self.variant_url('thumb'),
+                'card': self.variant_url('card'),
+                'detail': self.variant_url('detail'),
+            },
             'is_primary': self.is_primary,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -149,3 +310,75 @@ class ProductImage(db.Model):
     def __repr__(self):
         return f'<ProductImage {self.id} for Product {self.product_id}>'
 
+
+class UploadBlob(db.Model):
+    """
+    One stored upload, addressed by the sha256 of its bytes
+
+    Every ProductImage pointing at the same bytes shares the blob's file (and
+    its resized variants). ref_count tracks how many images use it; when it
+    drops to zero the row and its files are deleted (see products/storage.py).
+    """
+    content_hash = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(300), nullable=False)  # relative to the upload folder
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<UploadBlob {self.content_hash[:12]} refs={self.ref_count}>'
+
+
+def bound_metadata():
+    """(engine, MetaData) for the default database and every bind (e.g. 'messages')"""
+    for bind_key, metadata in db.metadatas.items():
+        yield db.engines[bind_key], metadata
+
+
+def create_missing_columns():
+    """
+    Add nullable columns declared on the models that existing tables don't have yet
+
+    db.create_all() never alters existing tables, so new optional columns
+    (e.g. ProductImage variant URLs) are added here with ALTER TABLE.
+    Non-nullable columns need a real migration and are only reported.
+    """
+    for engine, metadata in bound_metadata():
+        _add_missing_columns(engine, metadata)
+
+
+def _add_missing_columns(engine, metadata):
+    inspector = db.inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logging.getLogger(__name__).warning(
+                        f"Column {table.name}.{column.name} is missing and not nullable - migrate manually"
+                    )
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(db.text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+
+
+def create_missing_indexes():
+    """
+    Create any index declared on the models that the database doesn't have yet
+
+    db.create_all() only creates indexes together with brand new tables, so a
+    database file made before an index was added would never get it. Safe to
+    run on every startup - existing indexes are skipped.
+    """
+    for engine, metadata in bound_metadata():
+        for table in metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(engine, checkfirst=True)
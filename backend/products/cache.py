@@ -0,0 +1,193 @@
+"""
+Response cache for the read-only product endpoints
+
+GET /products, GET /products/<id> and GET /products/user/<id> return the same
+JSON to almost everyone, and the catalog is read far more often than it is
+written. Rather than rebuilding the query and re-serializing every row on each
+hit, the finished JSON body is kept in a bounded in-process cache:
+
+- entries expire after a TTL and the least recently used entry is evicted
+  once the cache is full
+- list entries are keyed on the normalized query parameters, so
+  `?page=1&category=books` and `?category=books&page=1` share an entry
+- every entry remembers which products it contains, so writes can invalidate
+  exactly the entries they affect (see invalidate_product())
+
+Only responses that don't depend on who is asking are cached: public products,
+public feeds, and seller listings viewed by someone other than the seller.
+
+The cache is per process. Invalidation reaches the worker that handled the
+write immediately; other workers catch up within the TTL.
+"""
+import os
+
+from flask import current_app
+
+from caches import LRUCache
+from products.conditional import add_validators, is_not_modified, not_modified_response
+
+# Query params that change the result of each endpoint. Anything else
+# (e.g. cache-busting timestamps) is ignored when building cache keys.
+LIST_PARAMS = (
+    'page', 'page_size', 'cursor', 'include_total', 'q', 'category',
+    'min_price', 'max_price', 'condition', 'sort', 'order', 'status',
+)
+USER_LIST_PARAMS = ('page', 'page_size', 'cursor', 'include_total')
+
+# Product fields that decide whether (and where) a product shows up in a feed.
+# Changing anything else only affects entries that already contain the product.
+LISTING_FIELDS = (
+    'title', 'description', 'price', 'category', 'condition', 'status', 'is_public',
+)
+
+LISTS_TAG = 'lists'
+
+
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'last_modified', 'tags', 'product_ids')
+
+    def __init__(self, body, etag, last_modified, tags, product_ids):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.tags = tags
+        self.product_ids = product_ids
+
+
+class ResponseCache(LRUCache):
+    """
+    LRU cache of response bodies (CacheEntry) with a per-entry TTL
+
+    Entries can be tagged and can record the product ids they contain; both
+    are used to invalidate entries when the catalog changes.
+    """
+
+    def __init__(self, max_entries=1024, ttl=60):
+        super().__init__(max_entries, ttl=ttl)
+        self.invalidations = 0
+
+    def store(self, key, body, etag=None, last_modified=None, tags=(), product_ids=()):
+        """Cache a response body with its validators"""
+        self.set(key, CacheEntry(body, etag, last_modified, frozenset(tags), frozenset(product_ids)))
+
+    def invalidate(self, tags=(), product_ids=()):
+        """Drop every entry carrying one of `tags` or containing one of `product_ids`"""
+        tags = set(tags)
+        product_ids = set(product_ids)
+        dropped = self.forget_where(lambda entry: entry.tags & tags or entry.product_ids & product_ids)
+        with self._lock:
+            self.invalidations += dropped
+        return dropped
+
+    def stats(self):
+        """Counters for monitoring (exposed at GET /products/cache/stats)"""
+        stats = super().stats()
+        stats["invalidations"] = self.invalidations
+        return stats
+
+
+# Shared by all product routes in this process (configured by init_product_cache)
+product_cache = ResponseCache()
+
+
+def init_product_cache(app):
+    """
+    Configure the cache from app config / environment
+
+    PRODUCT_CACHE_MAX_ENTRIES (default 1024, 0 disables caching)
+    PRODUCT_CACHE_TTL seconds (default 60)
+    """
+    product_cache.max_entries = int(app.config.get(
+        'PRODUCT_CACHE_MAX_ENTRIES', os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 1024)))
+    product_cache.ttl = float(app.config.get(
+        'PRODUCT_CACHE_TTL', os.environ.get('PRODUCT_CACHE_TTL', 60)))
+    product_cache.clear()
+
+
+def _normalized_args(args, allowed):
+    """Sorted (name, value) pairs of the non-empty params that affect the result"""
+    return tuple(sorted(
+        (name, args.get(name, '').strip())
+        for name in allowed
+        if args.get(name, '').strip() != '' or (name == 'cursor' and name in args)
+    ))
+
+
+def list_key(args):
+    return ('list', _normalized_args(args, LIST_PARAMS))
+
+
+def user_list_key(user_id, args):
+    return ('user', user_id, _normalized_args(args, USER_LIST_PARAMS))
+
+
+def product_key(product_id):
+    return ('product', product_id)
+
+
+def user_tag(user_id):
+    return f'user:{user_id}'
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def is_listed(product):
+    """Whether a product can appear in public feeds (with any status filter)"""
+    return bool(product.is_public)
+
+
+def listing_snapshot(product):
+    """Capture the fields that decide feed membership, before an update"""
+    return {field: getattr(product, field) for field in LISTING_FIELDS}
+
+
+def invalidate_product(product, before=None, created=False, deleted=False):
+    """
+    Drop the cache entries affected by a write to `product`
+
+    - the product's own detail entry and any list page that contains it are
+      always dropped
+    - if the product is (or was) visible in public feeds and the write could
+      change which feeds it appears in - a create, a delete, or an update to
+      one of LISTING_FIELDS - every public feed and the seller's listings are
+      dropped too, since the product may now belong on pages it wasn't on
+
+    `before` is listing_snapshot(product) taken before an update.
+    """
+    tags = {product_tag(product.id)}
+
+    if created or deleted:
+        affects_lists = is_listed(product)
+    else:
+        before = before or {}
+        changed = any(before.get(field) != getattr(product, field) for field in LISTING_FIELDS)
+        was_listed = bool(before.get('is_public'))
+        affects_lists = changed and (was_listed or is_listed(product))
+
+    if affects_lists:
+        tags.update({LISTS_TAG, user_tag(product.user_id)})
+
+    return product_cache.invalidate(tags=tags, product_ids=[product.id])
+
+
+def cached_response(entry):
+    """Rebuild a JSON response (or a 304 if the client is up to date) from a cache entry"""
+    if entry.etag and is_not_modified(entry.etag, entry.last_modified):
+        response = not_modified_response(entry.etag, entry.last_modified)
+    else:
+        response = current_app.response_class(entry.body, status=200, mimetype=current_app.json.mimetype)
+        if entry.etag:
+            add_validators(response, entry.etag, entry.last_modified)
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+
+def store_response(key, response, tags=(), product_ids=()):
+    """Cache the body and validators of a freshly built JSON response and return the response"""
+    etag, _ = response.get_etag()
+    product_cache.store(key, response.get_data(), etag=etag, last_modified=response.last_modified,
+                        tags=tags, product_ids=product_ids)
+    response.headers['X-Cache'] = 'MISS'
+    return response
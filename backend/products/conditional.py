@@ -0,0 +1,72 @@
+"""
+Conditional GET support (ETag / Last-Modified) for product resources
+
+Every product carries `updated_at`, so a response's validators can be derived
+from the ids and timestamps of the products it contains - before any of them
+is serialized. When the client already holds the current version
+(If-None-Match / If-Modified-Since) the route answers 304 Not Modified with no
+body, skipping serialization entirely.
+
+Responses are sent with `Cache-Control: no-cache`, which lets the browser keep
+a copy but makes it revalidate on every use, so polling and back-navigation
+become cheap 304s instead of full downloads.
+"""
+import hashlib
+import json
+from datetime import timezone
+
+from flask import current_app, request
+
+
+def compute_etag(products, meta=None):
+    """
+    Strong ETag for a response made of `products`
+
+    Hashes each product's id and updated_at plus any page metadata (total,
+    next_cursor, ...), so the tag changes whenever the body would.
+    """
+    digest = hashlib.sha1()
+    for product in products:
+        updated = product.updated_at.isoformat() if product.updated_at else ''
+        digest.update(f"{product.id}:{updated};".encode())
+    if meta:
+        digest.update(json.dumps(meta, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def compute_last_modified(products):
+    """Most recent updated_at among `products` (timezone-aware UTC), or None"""
+    stamps = [p.updated_at for p in products if p.updated_at]
+    if not stamps:
+        return None
+    # HTTP dates have one-second resolution
+    return max(stamps).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def is_not_modified(etag, last_modified=None):
+    """
+    Whether the client's cached copy is still current
+
+    If-None-Match takes precedence; If-Modified-Since is only consulted when
+    the request has no If-None-Match header (RFC 9110 section 13.2.2).
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def add_validators(response, etag, last_modified=None, private=False):
+    """Attach ETag, Last-Modified and revalidation headers to a response"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+def not_modified_response(etag, last_modified=None, private=False):
+    """Empty 304 response carrying the same validators as the full response"""
+    response = current_app.response_class(status=304)
+    return add_validators(response, etag, last_modified, private=private)
@@ -0,0 +1,175 @@
+"""
+Image derivative pipeline for uploaded product photos
+
+Product photos arrive as full-size camera JPEGs (several MB each). Serving
+those on the listing grid is wasteful, so after an upload is committed the
+route hands the image to a small worker pool which, off the request thread:
+
+1. opens the original and applies its EXIF orientation
+2. renders a WebP variant for each view in VARIANTS (thumb / card / detail),
+   never larger than the original, with all EXIF metadata (camera serial,
+   GPS position, ...) stripped
+3. records the variant URLs on the ProductImage row, bumps the product's
+   updated_at (so ETags change) and invalidates the product's cached responses
+
+Until the variants exist, ProductImage.to_dict() falls back to the original.
+
+Pillow is an optional dependency: without it uploads still work, they just
+keep serving the original file.
+
+Existing images can be processed with:
+    python -m products.images
+"""
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed - serve originals only
+    Image = None
+    ImageOps = None
+
+from models import db, ProductImage
+from products.cache import invalidate_product, listing_snapshot
+from products.storage import BLOB_FILE_MODE, UPLOAD_URL_PREFIX, upload_dir
+
+logger = logging.getLogger(__name__)
+
+# view name -> longest edge in pixels
+VARIANTS = {
+    'thumb': 200,    # chat / small previews
+    'card': 480,     # product grid
+    'detail': 1280,  # product page
+}
+VARIANT_FORMAT = 'WEBP'
+VARIANT_EXTENSION = 'webp'
+VARIANT_QUALITY = 80
+
+_executor = None
+_app = None
+
+
+def init_image_pipeline(app):
+    """
+    Start the worker pool used to render image variants
+
+    IMAGE_PIPELINE_WORKERS (config or env, default 2) sets the pool size;
+    0 disables the pipeline.
+    """
+    global _executor, _app
+    workers = int(app.config.get('IMAGE_PIPELINE_WORKERS', os.environ.get('IMAGE_PIPELINE_WORKERS', 2)))
+    _app = app
+    if Image is None:
+        logger.warning("Pillow is not installed - product images will be served without resized variants")
+        return
+    if workers > 0 and _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-pipeline")
+
+
+def schedule_variants(image_id):
+    """Queue variant generation for a committed ProductImage (returns immediately)"""
+    if _executor is None:
+        return None
+    return _executor.submit(_process_image, _app, image_id)
+
+
+def _process_image(app, image_id):
+    with app.app_context():
+        try:
+            generate_variants(app, image_id)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to generate variants for image {image_id}: {e}")
+
+
+def render_variant(source, max_edge, destination):
+    """
+    Save a copy of `source` (a PIL image) no larger than max_edge, without metadata
+
+    The variant is written to a temporary file next to `destination` and
+    renamed over it, so a request (or another worker rendering the same
+    content-addressed bytes) never sees a half-written file, and a crash
+    mid-write leaves no truncated variant that generate_variants would
+    later take as already rendered.
+    """
+    variant = source.copy()
+    variant.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination), prefix='.variant-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            # No exif= argument: the variant is written without any EXIF block
+            variant.save(out, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        os.chmod(temp_path, BLOB_FILE_MODE)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def generate_variants(app, image_id):
+    """Render every variant of one image and record them (runs in a worker)"""
+    image = db.session.get(ProductImage, image_id)
+    if image is None or not image.url.startswith(UPLOAD_URL_PREFIX):
+        return
+
+    directory = upload_dir(app)
+    filename = image.url[len(UPLOAD_URL_PREFIX):]
+    stem = os.path.splitext(filename)[0]
+    variant_names = {name: f"{stem}_{name}.{VARIANT_EXTENSION}" for name in VARIANTS}
+    urls = {name: f"{UPLOAD_URL_PREFIX}{variant_name}" for name, variant_name in variant_names.items()}
+
+    # Content-addressed uploads share variants: if these bytes were processed
+    # for another listing already, just reuse the files
+    already_rendered = all(
+        os.path.exists(os.path.join(directory, variant_name)) for variant_name in variant_names.values()
+    )
+    if not already_rendered:
+        with Image.open(os.path.join(directory, filename)) as original:
+            # Rotate according to EXIF orientation before the metadata is dropped
+            source = ImageOps.exif_transpose(original)
+            if source.mode not in ('RGB', 'RGBA'):
+                source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+
+            for name, max_edge in VARIANTS.items():
+                render_variant(source, max_edge, os.path.join(directory, variant_names[name]))
+
+    image.thumb_url = urls['thumb']
+    image.card_url = urls['card']
+    image.detail_url = urls['detail']
+
+    # The serialized product changes, so its ETag and cached responses must too
+    product = image.product
+    product.updated_at = datetime.utcnow()
+    db.session.commit()
+    invalidate_product(product, before=listing_snapshot(product))
+
+    logger.info(f"Generated {len(urls)} variants for image {image_id}")
+
+
+def backfill_variants(app):
+    """Synchronously generate variants for every uploaded image that has none"""
+    if Image is None:
+        print("Pillow is not installed")
+        return 0
+    with app.app_context():
+        pending = [
+            image.id for image in
+            ProductImage.query.filter(ProductImage.detail_url.is_(None)).all()
+        ]
+        for image_id in pending:
+            try:
+                generate_variants(app, image_id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"image {image_id}: {e}")
+        return len(pending)
+
+
+if __name__ == "__main__":
+    from app import app as flask_app
+    count = backfill_variants(flask_app)
+    print(f"Processed {count} image(s)")
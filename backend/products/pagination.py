@@ -0,0 +1,109 @@
+"""
+Keyset (cursor) pagination for product feeds
+
+Offset pagination (`?page=N`) makes the database count the whole filtered set
+and then walk past every skipped row, so deep pages get slower and slower.
+Keyset pagination instead remembers where the last page ended - the value of
+the active sort column plus the product id as a tie-breaker - and asks for the
+rows that come after it. With an index on the sort column every page costs the
+same, whether it is the first or the 500th.
+
+The position is handed to the client as an opaque `next_cursor` string
+(base64-encoded JSON). Clients should send it back unchanged as `?cursor=`.
+"""
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models import Product
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor can't be decoded or doesn't match the request"""
+
+
+def encode_cursor(sort_field, sort_order, value, product_id):
+    """Pack the position after the last row of a page into an opaque string"""
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    payload = {"s": sort_field, "o": sort_order, "v": value, "id": product_id}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_field, sort_order):
+    """
+    Unpack a cursor produced by encode_cursor()
+
+    The cursor must have been issued for the same sort field and order as the
+    current request, otherwise the position it points to is meaningless.
+    Returns (value, product_id).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value, product_id = payload["v"], int(payload["id"])
+        if payload["s"] != sort_field or payload["o"] != sort_order:
+            raise InvalidCursor("cursor does not match sort parameters")
+        if sort_field in ("created_at", "updated_at"):
+            value = datetime.fromisoformat(value)
+    except InvalidCursor:
+        raise
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor("invalid cursor")
+    return value, product_id
+
+
+def keyset_paginate(query, sort_expr, sort_field, sort_order, cursor=None,
+                    page_size=20, include_total=False):
+    """
+    Fetch one page of `query` ordered by (sort_expr, Product.id)
+
+    `query` must not be ordered yet. `cursor` is the raw value of the
+    `cursor` request arg (empty/None for the first page). Raises
+    InvalidCursor for malformed cursors.
+
+    Returns (products, meta) where meta holds page_size, next_cursor,
+    has_next and, only if include_total is True, total.
+    """
+    descending = sort_order != "asc"
+    meta = {"page_size": page_size}
+
+    # The total is the expensive part of offset pagination, so only pay for it on request
+    if include_total:
+        meta["total"] = query.order_by(None).count()
+
+    if cursor:
+        last_value, last_id = decode_cursor(cursor, sort_field, sort_order)
+        if descending:
+            query = query.filter(or_(
+                sort_expr < last_value,
+                and_(sort_expr == last_value, Product.id < last_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_expr > last_value,
+                and_(sort_expr == last_value, Product.id > last_id)
+            ))
+
+    if descending:
+        query = query.order_by(sort_expr.desc(), Product.id.desc())
+    else:
+        query = query.order_by(sort_expr.asc(), Product.id.asc())
+
+    # Select the sort key alongside each product (it may not be a Product column,
+    # e.g. the search rank) and read one extra row to know whether a next page exists
+    rows = query.add_columns(sort_expr.label("_sort_key")).limit(page_size + 1).all()
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_next:
+        last_product, last_key = rows[-1]
+        next_cursor = encode_cursor(sort_field, sort_order, last_key, last_product.id)
+
+    meta["next_cursor"] = next_cursor
+    meta["has_next"] = has_next
+    return [product for product, _ in rows], meta
@@ -1,16 +1,29 @@
-from flask import Blueprint, request, jsonify, session, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, send_from_directory, current_app
 from models import db, Product, ProductImage, User
-from sqlalchemy import or_, and_
+from auth.identity import current_user_id
+from auth.monitoring import require_stats_token
+from products.search import apply_search
+from products.pagination import keyset_paginate, InvalidCursor
+from products.conditional import (
+    compute_etag, compute_last_modified, is_not_modified, not_modified_response, add_validators
+)
+from products.images import schedule_variants
+from products.storage import (
+    store_upload, blob_url, release_images, delete_unreferenced_blobs, upload_dir, cache_headers
+)
+from products.cache import (
+    product_cache, cached_response, store_response, invalidate_product, listing_snapshot,
+    list_key, user_list_key, product_key, product_tag, user_tag, LISTS_TAG
+)
+from sqlalchemy.orm import joinedload, selectinload
 import logging
-import os
-import time
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 
 products_bp = Blueprint("products", __name__)
 logger = logging.getLogger(__name__)
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
-UPLOAD_FOLDER = 'static/uploads'
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -19,7 +32,8 @@ def allowed_file(filename):
 # Helper: Check if user is authenticated
 def get_current_user_id():
     """Return current user ID from session, or None if not authenticated"""
-    return session.get("user_id")
+    # cached per request and process; stale cookies of deleted users give None
+    return current_user_id()
 
 def require_auth():
     """Return user_id if authenticated, otherwise return error response"""
@@ -28,6 +42,54 @@ def require_auth():
         return None, (jsonify({"error": "authentication required"}), 401)
     return user_id, None
 
+# Helper: Offset pagination metadata returned by list endpoints
+def offset_page_meta(pagination):
+    return {
+        "page": pagination.page,
+        "page_size": pagination.per_page,
+        "total": pagination.total,
+        "total_pages": pagination.pages,
+        "has_next": pagination.has_next,
+        "has_prev": pagination.has_prev
+    }
+
+# Helper: Build (or short-circuit) the response for one page of products
+def product_page_response(products, meta, cache_key=None, tags=(), extra=None):
+    """
+    Serialize a page of products as {"items": [...], **meta, **extra}
+
+    The ETag is computed from the products' ids and updated_at first, so a
+    client that already has this page gets a 304 without anything being
+    serialized. Full responses are stored in the response cache under
+    cache_key (if given).
+    
+    Pages get no Last-Modified: deleting a listing changes a page without
+    making any of its products newer, so only the ETag is reliable here.
+    """
+    etag = compute_etag(products, {**meta, **(extra or {})})
+    private = cache_key is None
+    if is_not_modified(etag):
+        return not_modified_response(etag, private=private)
+    
+    # Serialize results - for list view, include seller and thumbnail
+    items = [
+        product.to_dict(include_seller=True, include_images=True)
+        for product in products
+    ]
+    response = jsonify({"items": items, **meta, **(extra or {})})
+    add_validators(response, etag, private=private)
+    if cache_key is not None:
+        store_response(cache_key, response, tags=tags, product_ids=[p.id for p in products])
+    return response, 200
+
+# Helper: Eager-load everything to_dict(include_seller=True, include_images=True) needs
+def with_list_relations(query):
+    """
+    Load sellers (joined) and images (one batched IN query) for a whole page at once,
+    so serializing N products costs a constant number of queries instead of 2N
+    """
+    return query.options(joinedload(Product.seller), selectinload(Product.images))
+
 
 # ============================================================================
 # GET /products - List all products with pagination, search, and filters
@@ -38,19 +100,33 @@ def list_products():
     List products with optional filters:
     - page: page number (default 1)
     - page_size: items per page (default 20, max 100)
-    - q: search query (searches title and description)
+    - cursor: keyset pagination instead of pages - pass an empty value for the
+      first page, then the returned next_cursor (page is ignored)
+    - include_total: with cursor, also count the full result set (default false)
+    - q: search query (full-text, prefix-matched against title and description)
     - category: filter by category
     - min_price: minimum price
     - max_price: maximum price
     - condition: filter by condition (new, like-new, good, fair, poor)
-    - sort: sort field (created_at, price, title) default: created_at
+    - sort: sort field (relevance, created_at, price, title) default: relevance
+      when q is given, created_at otherwise
     - order: sort order (asc, desc) default: desc
     - status: filter by status (active, sold, reserved) default: active
+    
+    Responses are served from the product response cache when possible.
     """
     try:
+        # Public feeds look the same to everyone, so try the cache first
+        cache_key = list_key(request.args)
+        cached = product_cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached)
+        
         # Pagination params
         page = request.args.get('page', 1, type=int)
-        page_size = min(request.args.get('page_size', 20, type=int), 100)
+        page_size = max(1, min(request.args.get('page_size', 20, type=int), 100))
+        cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
         
         # Search and filter params
         search_query = request.args.get('q', '').strip()
@@ -61,7 +137,7 @@ def list_products():
         status = request.args.get('status', 'active').strip()
         
         # Sort params
-        sort_field = request.args.get('sort', 'created_at').strip()
+        sort_field = request.args.get('sort', 'relevance' if search_query else 'created_at').strip()
         sort_order = request.args.get('order', 'desc').strip()
         
         # Build query
@@ -83,45 +159,48 @@ def list_products():
         if max_price is not None:
             query = query.filter(Product.price <= max_price)
         
-        # Search in title and description
+        # Full-text search in title and description
+        rank_column = None
         if search_query:
-            search_pattern = f"%{search_query}%"
-            query = query.filter(
-                or_(
-                    Product.title.ilike(search_pattern),
-                    Product.description.ilike(search_pattern)
-                )
-            )
-        
-        # Apply sorting
-        valid_sort_fields = {'created_at', 'price', 'title', 'updated_at'}
-        if sort_field not in valid_sort_fields:
-            sort_field = 'created_at'
+            query, rank_column = apply_search(query, search_query)
         
-        sort_column = getattr(Product, sort_field)
-        if sort_order == 'asc':
-            query = query.order_by(sort_column.asc())
+        # Resolve sorting: (sort expression, direction), with id as the tie-breaker
+        if sort_field == 'relevance' and rank_column is not None:
+            # bm25 rank: lower is a better match, so best matches come first
+            sort_expr = rank_column
+            sort_order = 'asc'
         else:
-            query = query.order_by(sort_column.desc())
-        
-        # Execute pagination
-        pagination = query.paginate(page=page, per_page=page_size, error_out=False)
-        
-        # Serialize results - for list view, include seller and thumbnail
-        items = [
-            product.to_dict(include_seller=True, include_images=True)
-            for product in pagination.items
-        ]
+            valid_sort_fields = {'created_at', 'price', 'title', 'updated_at'}
+            if sort_field not in valid_sort_fields:
+                sort_field = 'created_at'
+            sort_expr = getattr(Product, sort_field)
+            if sort_order != 'asc':
+                sort_order = 'desc'
+        
+        query = with_list_relations(query)
+        
+        # Cursor mode: ?cursor= (empty for the first page) switches to keyset pagination
+        if cursor is not None:
+            products, meta = keyset_paginate(
+                query, sort_expr, sort_field, sort_order,
+                cursor=cursor, page_size=page_size, include_total=include_total
+            )
+        else:
+            # Apply sorting
+            if sort_order == 'asc':
+                query = query.order_by(sort_expr.asc(), Product.id.asc())
+            else:
+                query = query.order_by(sort_expr.desc(), Product.id.desc())
+            
+            # Execute pagination
+            pagination = query.paginate(page=page, per_page=page_size, error_out=False)
+            products = pagination.items
+            meta = offset_page_meta(pagination)
         
-        return jsonify({
-            "items": items,
-            "page": pagination.page,
-            "page_size": pagination.per_page,
-            "total": pagination.total,
-            "total_pages": pagination.pages,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev
-        }), 200
+        return product_page_response(products, meta, cache_key, tags=[LISTS_TAG])
+    
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
         
     except Exception as e:
         logger.error(f"Error listing products: {e}")
@@ -135,8 +214,15 @@ def list_products():
 def get_product(product_id):
     """
     Get detailed information about a specific product
+    Public products are served from the product response cache when possible.
     """
     try:
+        # Only public products are cached, so a hit is safe to return to anyone
+        cache_key = product_key(product_id)
+        cached = product_cache.get(cache_key)
+        if cached is not None:
+            return cached_response(cached)
+        
         product = Product.query.get(product_id)
         
         if not product:
@@ -147,8 +233,19 @@ def get_product(product_id):
         if not product.is_public and product.user_id != current_user_id:
             return jsonify({"error": "product not found"}), 404
         
+        # Answer 304 if the client already has this version
+        etag = compute_etag([product])
+        last_modified = compute_last_modified([product])
+        private = not product.is_public
+        if is_not_modified(etag, last_modified):
+            return not_modified_response(etag, last_modified, private=private)
+        
         # Return full details with seller and images
-        return jsonify(product.to_dict(include_seller=True, include_images=True)), 200
+        response = jsonify(product.to_dict(include_seller=True, include_images=True, image_variant='detail'))
+        add_validators(response, etag, last_modified, private=private)
+        if product.is_public:
+            store_response(cache_key, response, tags=[product_tag(product.id)], product_ids=[product.id])
+        return response, 200
 
     except Exception as e:
         logger.error(f"Error getting product {product_id}: {e}")
@@ -229,7 +326,6 @@ def create_product():
         )
         
         db.session.add(product)
-        # Flush to get the product ID if needed, though we use timestamp for filename
         db.session.flush() 
         
         # Handle Image Upload
@@ -237,36 +333,42 @@ def create_product():
             file = request.files['image']
             if file and allowed_file(file.filename):
                 filename = secure_filename(file.filename)
-                timestamp = int(time.time())
-                unique_filename = f"{timestamp}_{filename}"
-                
-                # Ensure upload directory exists
-                upload_path = os.path.join(current_app.root_path, UPLOAD_FOLDER)
-                if not os.path.exists(upload_path):
-                    os.makedirs(upload_path)
+                if getattr(file.stream, 'size', None) == 0:
+                    db.session.rollback()
+                    return jsonify({"error": "image is empty"}), 400
                 
-                file.save(os.path.join(upload_path, unique_filename))
+                # Store under the hash of the bytes (shared with identical uploads)
+                blob = store_upload(current_app, file, filename)
                 
                 # Create ProductImage
-                # URL format: /products/uploads/<filename>
-                image_url = f"/products/uploads/{unique_filename}"
-                
+                # URL format: /products/uploads/<ab>/<sha256>.<ext>
                 product_image = ProductImage(
                     product=product,
-                    url=image_url,
+                    url=blob_url(blob.path),
+                    content_hash=blob.content_hash,
                     is_primary=True
                 )
                 db.session.add(product_image)
 
         db.session.commit()
+        invalidate_product(product, created=True)
+        
+        # Render resized thumbnail/card/detail variants in the background
+        for image in product.images:
+            schedule_variants(image.id)
         
         logger.info(f"User {user_id} created product {product.id}")
         
         return jsonify({
             "ok": True,
             "msg": "product created",
-            "product": product.to_dict(include_seller=True, include_images=True)
+            "product": product.to_dict(include_seller=True, include_images=True, image_variant='detail')
         }), 201
+    
+    except HTTPException:
+        # Upload rejected while the body was parsed (413 too large / 415 not an image)
+        db.session.rollback()
+        raise
         
     except Exception as e:
         db.session.rollback()
@@ -277,11 +379,15 @@ def create_product():
 # ============================================================================
 # GET /products/uploads/<filename> - Serve uploaded images
 # ============================================================================
-@products_bp.route("/uploads/<filename>")
+@products_bp.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    """Serve uploaded files"""
-    upload_path = os.path.join(current_app.root_path, UPLOAD_FOLDER)
-    return send_from_directory(upload_path, filename)
+    """
+    Serve uploaded files
+    Content-addressed files never change, so they are cacheable forever;
+    Range and conditional requests are handled by send_from_directory.
+    """
+    response = send_from_directory(upload_dir(current_app), filename, conditional=True)
+    return cache_headers(response, filename)
 
 
 # ============================================================================
@@ -308,6 +414,7 @@ def update_product(product_id):
             return jsonify({"error": "permission denied"}), 403
         
         data = request.get_json() or {}
+        before = listing_snapshot(product)
         
         # Update fields if provided
         if 'title' in data:
@@ -355,13 +462,14 @@ def update_product(product_id):
             product.is_public = bool(data['is_public'])
         
         db.session.commit()
+        invalidate_product(product, before=before)
         
         logger.info(f"User {user_id} updated product {product_id}")
         
         return jsonify({
             "ok": True,
             "msg": "product updated",
-            "product": product.to_dict(include_seller=True, include_images=True)
+            "product": product.to_dict(include_seller=True, include_images=True, image_variant='detail')
         }), 200
         
     except Exception as e:
@@ -393,8 +501,12 @@ def delete_product(product_id):
         if product.user_id != user_id:
             return jsonify({"error": "permission denied"}), 403
         
+        # Drop the image files' reference counts in the same transaction
+        released = release_images(product.images)
         db.session.delete(product)
         db.session.commit()
+        invalidate_product(product, deleted=True)
+        delete_unreferenced_blobs(current_app, released)
         
         logger.info(f"User {user_id} deleted product {product_id}")
         
@@ -412,7 +524,10 @@ def delete_product(product_id):
 @products_bp.route("/user/<int:user_id>", methods=["GET"])
 def get_user_products(user_id):
     """
-    Get all products listed by a specific user
+    Get all products listed by a specific user, newest first
+    - page / page_size: offset pagination (default 1 / 20, max 100)
+    - cursor: keyset pagination instead of pages (empty value for the first page)
+    - include_total: with cursor, also count the user's listings (default false)
     """
     try:
         # Check if user exists
@@ -422,38 +537,58 @@ def get_user_products(user_id):
         
         # Pagination
         page = request.args.get('page', 1, type=int)
-        page_size = min(request.args.get('page_size', 20, type=int), 100)
+        page_size = max(1, min(request.args.get('page_size', 20, type=int), 100))
+        cursor = request.args.get('cursor')
+        include_total = request.args.get('include_total', 'false').lower() == 'true'
         
         # Build query - only show public products unless viewing own profile
         current_user_id = get_current_user_id()
+        
+        # What visitors see is the same for everyone, so it can be cached
+        cache_key = user_list_key(user_id, request.args) if current_user_id != user_id else None
+        if cache_key:
+            cached = product_cache.get(cache_key)
+            if cached is not None:
+                return cached_response(cached)
+        
         query = Product.query.filter_by(user_id=user_id)
         
         if current_user_id != user_id:
             query = query.filter_by(is_public=True, status='active')
         
-        query = query.order_by(Product.created_at.desc())
-        
-        pagination = query.paginate(page=page, per_page=page_size, error_out=False)
-        
-        items = [
-            product.to_dict(include_seller=True, include_images=True)
-            for product in pagination.items
-        ]
+        query = with_list_relations(query)
         
-        return jsonify({
-            "items": items,
-            "page": pagination.page,
-            "page_size": pagination.per_page,
-            "total": pagination.total,
-            "total_pages": pagination.pages,
-            "has_next": pagination.has_next,
-            "has_prev": pagination.has_prev,
-            "seller": {
-                "id": user.id,
-                "username": user.username
-            }
-        }), 200
+        if cursor is not None:
+            products, meta = keyset_paginate(
+                query, Product.created_at, 'created_at', 'desc',
+                cursor=cursor, page_size=page_size, include_total=include_total
+            )
+        else:
+            query = query.order_by(Product.created_at.desc(), Product.id.desc())
+            pagination = query.paginate(page=page, per_page=page_size, error_out=False)
+            products = pagination.items
+            meta = offset_page_meta(pagination)
+        
+        return product_page_response(
+            products, meta, cache_key, tags=[user_tag(user_id)],
+            extra={"seller": {"id": user.id, "username": user.username}}
+        )
+    
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
         
     except Exception as e:
         logger.error(f"Error getting products for user {user_id}: {e}")
-        return jsonify({"error": "failed to get user products"}), 500
\ No newline at end of file
+        return jsonify({"error": "failed to get user products"}), 500
+
+
+# ============================================================================
+# GET /products/cache/stats - Response cache counters for monitoring
+# ============================================================================
+@products_bp.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Hit/miss/eviction counters of this worker's product response cache (needs STATS_TOKEN)"""
+    error = require_stats_token()
+    if error:
+        return error
+    return jsonify(product_cache.stats()), 200
@@ -0,0 +1,158 @@
+"""
+Full-text search for product listings
+
+On SQLite the catalog is indexed by an FTS5 shadow table (`product_fts`) that
+mirrors `product.title` and `product.description`. Triggers on the `product`
+table keep it in sync on every insert, update and delete, so the routes never
+have to touch it directly.
+
+`apply_search()` turns the user's search box text into an FTS5 MATCH
+expression (every word is prefix-matched, so "cam" finds "camera") and joins
+its matches onto an existing Product query, which means the usual category,
+price, condition and status filters are applied on top. It also returns the
+bm25 rank column so callers can order by relevance.
+
+The matches are joined as a MATERIALIZED CTE rather than joining product_fts
+directly. Joined directly, SQLite may drive the join from `product` (e.g.
+through a feed index when sorting by date, or for paginate()'s count) and run
+the MATCH once per product row - seconds to minutes on a large catalog. The
+CTE runs the MATCH exactly once and looks the matching products up by id.
+
+On databases without FTS5 the module falls back to the old ILIKE scan.
+"""
+import logging
+import re
+
+from flask import current_app
+from sqlalchemy import column, false, or_, select, table, text
+
+from models import db, Product
+
+logger = logging.getLogger(__name__)
+
+# Lightweight handle on the virtual table for use in SQLAlchemy queries.
+# `product_fts` (the table-name column) is what FTS5 expects on the left of MATCH
+# and `rank` is the built-in bm25() relevance score (lower is better).
+product_fts = table("product_fts", column("rowid"), column("rank"), column("product_fts"))
+
+# Words are runs of letters/digits; everything else (quotes, operators, etc.)
+# is dropped so user input can never produce an invalid MATCH expression
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Cap the number of terms so a pasted paragraph can't build a huge query
+MAX_SEARCH_TERMS = 8
+
+_SCHEMA_STATEMENTS = [
+    # External-content table: the text lives in `product`, FTS5 only keeps the index.
+    # prefix='2 3' adds prefix indexes so short "search as you type" terms stay fast.
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        title,
+        description,
+        content='product',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF title, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO product_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+def init_product_search(app):
+    """
+    Create the FTS5 index and its sync triggers if they don't exist yet
+
+    Must be called inside an app context after db.create_all(). When the index
+    is created for the first time it is rebuilt from the existing products.
+    Sets app.extensions['product_search'] to True when full-text search is
+    available, False otherwise (non-SQLite database or SQLite without FTS5).
+    """
+    engine = db.engine
+    available = False
+
+    if engine.dialect.name == "sqlite":
+        try:
+            with engine.begin() as conn:
+                existed = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='product_fts'")
+                ).first() is not None
+
+                for statement in _SCHEMA_STATEMENTS:
+                    conn.execute(text(statement))
+
+                if not existed:
+                    # Index every product that was created before search existed
+                    conn.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+                    logger.info("Built product full-text search index")
+            available = True
+        except Exception as e:
+            logger.warning(f"Full-text search unavailable, falling back to ILIKE: {e}")
+
+    app.extensions["product_search"] = available
+    return available
+
+
+def build_match_expression(search_query):
+    """
+    Convert raw search box text into a safe FTS5 MATCH expression
+
+    Each word becomes a quoted prefix term and all terms must match, e.g.
+    'Sony cam' -> '"sony"* AND "cam"*'. Returns None if there are no words.
+    """
+    terms = _TOKEN_RE.findall(search_query.lower())[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+
+def apply_search(query, search_query):
+    """
+    Restrict a Product query to listings matching `search_query`
+
+    Returns a tuple (query, rank_column). rank_column can be used in
+    order_by() to sort by relevance; it is None when the ILIKE fallback
+    was used, in which case there is no relevance score.
+    """
+    if current_app.extensions.get("product_search"):
+        match = build_match_expression(search_query)
+        if not match:
+            # Nothing searchable (e.g. only punctuation): no listing can match
+            return query.filter(false()), None
+        matches = select(product_fts.c.rowid.label("id"), product_fts.c.rank).where(
+            product_fts.c.product_fts.op("MATCH")(match)
+        ).cte("search_match")
+        if db.engine.dialect.server_version_info >= (3, 35):
+            # Older SQLite has no MATERIALIZED hint (and no way to force the join order)
+            matches = matches.prefix_with("MATERIALIZED")
+        query = query.join(matches, matches.c.id == Product.id)
+        return query, matches.c.rank
+
+    # Fallback: substring scan over title and description
+    search_pattern = f"%{search_query}%"
+    query = query.filter(
+        or_(
+            Product.title.ilike(search_pattern),
+            Product.description.ilike(search_pattern)
+        )
+    )
+    return query, None
@@ -0,0 +1,365 @@
+"""
+Content-addressed storage for uploaded product images
+
+Uploads are stored under the sha256 of their bytes instead of
+"<timestamp>_<filename>":
+
+    static/uploads/3f/3fa9...e1.jpg
+
+- two users uploading camera.jpg in the same second can no longer collide
+- identical bytes are stored once, however many listings use them; each
+  UploadBlob row counts the ProductImages referencing it and the file is
+  deleted when the last one goes away
+- a URL's content can never change, so it is served with
+  `Cache-Control: immutable` and a one-year expiry
+
+Files from before this scheme ("1765059800_camera.jpg") keep working; they are
+served with normal revalidation headers.
+
+Uploads are ingested while the request body is being parsed (UploadRequest):
+each file part is written straight to a temporary file in the upload folder
+in small chunks, hashed incrementally, size-checked and sniffed for a known
+image signature as it arrives. Oversized or non-image uploads are rejected
+after the first offending chunk instead of after the whole body was buffered,
+and memory use per upload stays constant regardless of file size.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta
+
+from flask import Request, current_app
+from sqlalchemy import delete, event, exists
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from database import dialect_insert
+from models import db, UploadBlob, ProductImage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = 'static/uploads'
+UPLOAD_URL_PREFIX = '/products/uploads/'
+
+CHUNK_SIZE = 64 * 1024
+
+# "ab/<64 hex chars>..." - paths produced by blob_path() and its variants
+CONTENT_ADDRESSED_RE = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}[._]')
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Default per-file limit; MAX_IMAGE_UPLOAD_BYTES in app config overrides it
+DEFAULT_MAX_IMAGE_BYTES = 10 * 1024 * 1024
+
+# File signatures of the accepted image formats -> stored extension
+MAGIC_HEADER_BYTES = 12
+
+# Temp files are created 0600 by mkstemp; stored blobs must be readable by
+# whatever serves static/uploads (e.g. a reverse proxy running as another user)
+BLOB_FILE_MODE = 0o644
+
+# db.session.info key of the (temp path, final path) pairs waiting for a commit
+PENDING_FILES_KEY = 'pending_upload_files'
+
+
+def sniff_image_type(header):
+    """Return the image extension matching the first bytes of a file, or None"""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def upload_dir(app):
+    """Absolute path of the upload folder (created if missing)"""
+    path = os.path.join(app.root_path, UPLOAD_FOLDER)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def blob_path(content_hash, extension):
+    """Relative path of a blob: two-character fan-out directory, then the full hash"""
+    return f"{content_hash[:2]}/{content_hash}.{extension}"
+
+
+def blob_url(relative_path):
+    return f"{UPLOAD_URL_PREFIX}{relative_path}"
+
+
+def is_content_addressed(relative_path):
+    return CONTENT_ADDRESSED_RE.match(relative_path) is not None
+
+
+def normalize_extension(filename):
+    extension = filename.rsplit('.', 1)[1].lower()
+    return 'jpg' if extension == 'jpeg' else extension
+
+
+def hash_to_temp_file(stream, directory):
+    """
+    Copy a stream into a temporary file in `directory`, hashing it on the way
+
+    Returns (temp_path, sha256 hex digest, size in bytes).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.unlink(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size
+
+
+def store_upload(app, file, filename):
+    """
+    Store an uploaded file and take a reference on its blob
+
+    Files ingested by UploadRequest are already on disk and hashed, so they
+    are just moved into place; any other stream is hashed while it is copied
+    to a temporary file. When the request's transaction commits, the file
+    ends up at its content address (or is discarded, if those bytes are
+    already stored); when it rolls back, the file is discarded.
+    Must run inside the request's transaction: the reference count change is
+    committed (or rolled back) together with the ProductImage that uses it.
+
+    Returns the UploadBlob.
+    """
+    directory = upload_dir(app)
+    stream = file.stream
+    if isinstance(stream, IngestedUpload):
+        content_hash, size, extension = stream.content_hash, stream.size, stream.extension
+        temp_path = stream.detach()
+    else:
+        temp_path, content_hash, size = hash_to_temp_file(stream, directory)
+        extension = normalize_extension(filename)
+    return adopt_temp_file(directory, temp_path, content_hash, size, extension)
+
+
+def adopt_temp_file(directory, temp_path, content_hash, size, extension):
+    """
+    Reference the blob of an already-hashed temporary file
+
+    The reference is taken now, in the caller's transaction; the file is only
+    moved to its content address once that transaction commits (see
+    _place_pending_files). If it rolls back instead, or the session is closed
+    without committing, the temporary file is deleted and nothing is left
+    behind in the upload folder.
+    """
+    # Take the reference before touching the files: from here until the
+    # request's transaction ends, delete_unreferenced_blobs() can't remove them
+    blob = acquire_blob(content_hash, blob_path(content_hash, extension), size)
+    final_path = os.path.join(directory, blob.path)
+    db.session.info.setdefault(PENDING_FILES_KEY, []).append((temp_path, final_path))
+    return blob
+
+
+def _place_file(temp_path, final_path):
+    """Move a temporary file to its content address (or drop it if already stored)"""
+    if os.path.exists(final_path):
+        # Same bytes already on disk - keep the stored copy
+        os.unlink(temp_path)
+    else:
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(temp_path, final_path)
+        os.chmod(final_path, BLOB_FILE_MODE)
+
+
+@event.listens_for(db.session, "after_commit")
+def _place_pending_files(session):
+    # The blob rows are committed with a reference held, so a concurrent
+    # delete_unreferenced_blobs() will leave these paths alone
+    for temp_path, final_path in session.info.pop(PENDING_FILES_KEY, ()):
+        try:
+            _place_file(temp_path, final_path)
+        except OSError as e:
+            logger.error(f"Could not store upload {final_path}: {e}")
+
+
+@event.listens_for(db.session, "after_transaction_end")
+def _discard_pending_files(session, transaction):
+    # Runs after _place_pending_files on commit (nothing left to do then);
+    # on rollback or close the references are gone, so are the temp files
+    if transaction.parent is not None:
+        return
+    for temp_path, _ in session.info.pop(PENDING_FILES_KEY, ()):
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+
+def acquire_blob(content_hash, relative_path, size):
+    """
+    Increment a blob's reference count, creating the row on first use
+
+    A single INSERT ... ON CONFLICT DO UPDATE, so it can neither lose a
+    concurrent increment nor bump a row that a concurrent delete just
+    removed (the row is then simply created again). Returns the UploadBlob.
+    """
+    insert = dialect_insert(db.engine)
+    statement = insert(UploadBlob).values(
+        content_hash=content_hash, path=relative_path, size=size,
+        ref_count=1, created_at=datetime.utcnow()
+    ).on_conflict_do_update(
+        index_elements=[UploadBlob.content_hash],
+        set_={"ref_count": UploadBlob.ref_count + 1}
+    )
+    db.session.execute(statement)
+    return db.session.get(UploadBlob, content_hash, populate_existing=True)
+
+
+def release_images(images):
+    """
+    Drop the blob references held by `images` (before they are deleted)
+
+    Runs in the caller's transaction. Returns the affected content hashes,
+    to be passed to delete_unreferenced_blobs() after the commit.
+    """
+    hashes = [image.content_hash for image in images if image.content_hash]
+    for content_hash in hashes:
+        UploadBlob.query.filter_by(content_hash=content_hash).update(
+            {UploadBlob.ref_count: UploadBlob.ref_count - 1}, synchronize_session=False
+        )
+    return hashes
+
+
+def delete_unreferenced_blobs(app, hashes):
+    """
+    Delete blobs (rows, originals and variants) that no image references any more
+
+    Each blob is handled in its own short transaction that starts by deleting
+    the row - only if its count is still zero and no image uses the hash -
+    which takes the write lock before anything is read. An upload of the
+    same bytes either took its reference first (nothing is deleted) or waits
+    for the lock and then recreates the row and the file.
+    """
+    if not hashes:
+        return 0
+    directory = upload_dir(app)
+    deleted = 0
+    for content_hash in sorted(set(hashes)):
+        path = db.session.execute(
+            delete(UploadBlob)
+            .where(
+                UploadBlob.content_hash == content_hash,
+                UploadBlob.ref_count <= 0,
+                ~exists().where(ProductImage.content_hash == content_hash),
+            )
+            .returning(UploadBlob.path)
+        ).scalar()
+        if path is not None:
+            stem = os.path.basename(os.path.splitext(path)[0])
+            folder = os.path.join(directory, os.path.dirname(path))
+            for name in os.listdir(folder) if os.path.isdir(folder) else ():
+                if name.startswith(stem):
+                    os.unlink(os.path.join(folder, name))
+            deleted += 1
+        db.session.commit()
+    return deleted
+
+
+def cache_headers(response, relative_path):
+    """Long-lived caching for content-addressed files; revalidation for legacy names"""
+    if is_content_addressed(relative_path):
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        response.expires = datetime.utcnow() + timedelta(seconds=IMMUTABLE_MAX_AGE)
+    return response
+
+
+class IngestedUpload:
+    """
+    Writable, readable stand-in for Werkzeug's upload temp file
+
+    Werkzeug's multipart parser write()s each chunk of a file part here as it
+    is read from the socket. Every chunk goes straight to a temporary file in
+    the upload folder and into a running sha256, and the part is aborted as
+    soon as it exceeds max_bytes or its first bytes aren't a supported image.
+    """
+
+    def __init__(self, directory, max_bytes):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self._header = b''
+        self._detached = False
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.extension = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f"image exceeds the {self.max_bytes} byte limit")
+        if self.extension is None and len(self._header) < MAGIC_HEADER_BYTES:
+            self._header += data[:MAGIC_HEADER_BYTES - len(self._header)]
+            if len(self._header) == MAGIC_HEADER_BYTES:
+                self._check_signature()
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def _check_signature(self):
+        self.extension = sniff_image_type(self._header)
+        if self.extension is None:
+            self.close()
+            raise UnsupportedMediaType("upload is not a PNG, JPEG, GIF or WebP image")
+
+    def seek(self, offset, whence=0):
+        # The parser seeks to 0 once the part is complete. A non-empty part
+        # that never filled the signature window is too short to be an image
+        # (a bare 3-byte JPEG marker would otherwise pass the sniff); empty
+        # parts are left to the route, which answers "image is empty"
+        if self.extension is None and self.size > 0:
+            self.close()
+            raise UnsupportedMediaType("upload is not a PNG, JPEG, GIF or WebP image")
+        return self._file.seek(offset, whence)
+
+    @property
+    def content_hash(self):
+        return self._digest.hexdigest()
+
+    def detach(self):
+        """Hand the temp file over to storage; it won't be deleted on close"""
+        self._detached = True
+        self._file.close()
+        return self.path
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self._detached and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def __getattr__(self, name):
+        # read(), readline(), tell(), flush(), ... go to the real file
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """
+    Request class that ingests file uploads with IngestedUpload
+
+    The total body size is capped by Flask's MAX_CONTENT_LENGTH (rejected
+    from the Content-Length header before anything is read); each file part
+    by MAX_IMAGE_UPLOAD_BYTES.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_bytes = current_app.config.get('MAX_IMAGE_UPLOAD_BYTES', DEFAULT_MAX_IMAGE_BYTES)
+        # Reject early when the client announces the part's size
+        if content_length and content_length > max_bytes:
+            raise RequestEntityTooLarge(f"image exceeds the {max_bytes} byte limit")
+        return IngestedUpload(upload_dir(current_app), max_bytes)
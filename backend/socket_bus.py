@@ -0,0 +1,127 @@
+# backend/socket_bus.py
+"""
+Message bus for running several Socket.IO workers side by side
+
+A single SocketIO server only knows about the clients connected to its own
+process, so `socketio.emit(..., room="user_5")` misses user 5 if they are
+connected to another worker. With a message bus every worker publishes its
+emits to a shared channel and every worker delivers them to its local
+members of the room; join_room() stays local, which is exactly right since
+each client is connected to one worker.
+
+The bus is selected with SOCKETIO_MESSAGE_QUEUE:
+
+    (unset)                         single process, no bus
+    redis://localhost:6379/0        Redis pub/sub (needs the `redis` package)
+    amqp://... / kafka://... / zmq+tcp://...
+                                    any other transport python-socketio supports
+    sqlite:///instance/socket_bus.db
+                                    SQLiteBusManager below: a shared SQLite file,
+                                    for local multi-worker runs and tests without
+                                    a broker
+
+Run one worker per core on different ports behind a load balancer with
+sticky sessions (the long-polling transport needs every request of a session
+to reach the same worker), e.g.:
+
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 PORT=5001 python app.py
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 PORT=5002 python app.py
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import socketio
+
+# How often SQLiteBusManager checks for new messages, and how long they are kept
+SQLITE_BUS_POLL_INTERVAL = 0.02
+SQLITE_BUS_RETENTION = 60
+
+
+class SQLiteBusManager(socketio.PubSubManager):
+    """
+    Socket.IO client manager that uses a SQLite table as its pub/sub channel
+
+    Published messages are appended to a table in a file shared by all
+    workers; each worker polls for rows newer than the last one it has seen.
+    Rows older than SQLITE_BUS_RETENTION seconds are pruned. It adds up to
+    one poll interval of latency, so prefer Redis in production.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite:///instance/socket_bus.db', channel='flask-socketio',
+                 write_only=False, logger=None, poll_interval=SQLITE_BUS_POLL_INTERVAL):
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url
+        # Relative paths are relative to the backend folder, like instance/users.db
+        self.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._last_prune = 0.0
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connection(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            # WAL lets every worker read while another one publishes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS socketio_bus ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " channel TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _publish(self, data):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO socketio_bus (channel, payload, created_at) VALUES (?, ?, ?)",
+                (self.channel, pickle.dumps(data), now),
+            )
+            if now - self._last_prune > SQLITE_BUS_RETENTION:
+                conn.execute("DELETE FROM socketio_bus WHERE created_at < ?", (now - SQLITE_BUS_RETENTION,))
+                self._last_prune = now
+
+    def _fetch(self, after_id):
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, payload FROM socketio_bus WHERE channel = ? AND id > ? ORDER BY id",
+                (self.channel, after_id),
+            ).fetchall()
+
+    def _listen(self):
+        with self._lock:
+            row = self._connection().execute("SELECT MAX(id) FROM socketio_bus").fetchone()
+        # Only deliver what is published from now on
+        last_id = row[0] or 0
+        while True:
+            rows = self._fetch(last_id)
+            for last_id, payload in rows:
+                yield pickle.loads(payload)
+            if not rows:
+                self.server.sleep(self.poll_interval)
+
+
+def socketio_bus_options(url=None):
+    """
+    Extra SocketIO() keyword arguments for the configured message bus
+
+    Returns {} when SOCKETIO_MESSAGE_QUEUE is not set (single process).
+    """
+    url = url or os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+    if not url:
+        return {}
+    if url.startswith("sqlite://"):
+        return {"client_manager": SQLiteBusManager(url)}
+    # redis://, amqp://, kafka://, zmq... are handled by Flask-SocketIO itself
+    return {"message_queue": url}
@@ -0,0 +1,69 @@
+# backend/tests/conftest.py
+"""
+Shared fixtures: the app against a throwaway, seeded SQLite database
+
+The app reads its configuration from the environment at import time, so the
+environment is pointed at a temporary folder before anything imports it.
+Background workers, the rate limiter and the product response cache are off,
+so each request hits the database and nothing runs behind the test's back.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_workdir = tempfile.TemporaryDirectory()
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir.name, 'test.db')}",
+    "MESSAGES_DATABASE_URL": "",
+    "SOCKETIO_MESSAGE_QUEUE": "",
+    "RATELIMIT_STORAGE_URI": "memory://",
+    "EMAIL_TRANSPORT": "fake",
+    "EMAIL_OUTBOX_WORKER": "0",
+    "PENDING_SWEEPER": "0",
+    "PRODUCT_CACHE_MAX_ENTRIES": "0",
+})
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as app_module
+    from init_db import seed_database
+
+    app_module.limiter.enabled = False
+    with app_module.app.app_context():
+        seed_database(users=20, products=300, messages=100, with_image_files=False, quiet=True)
+    yield app_module.app
+    _workdir.cleanup()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def count_queries(app):
+    """count_queries(fn) -> (fn's result, number of SQL statements it ran)"""
+    from models import db
+
+    def run(fn):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            result = fn()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        return result, len(statements)
+    return run
@@ -0,0 +1,54 @@
+# backend/tests/test_caches.py
+"""
+The shared LRU/TTL cache and the User change hooks of the caches built on it
+"""
+import time
+
+from caches import LRUCache
+from models import db, User
+
+
+def test_lru_evicts_least_recently_used_and_expires(monkeypatch):
+    cache = LRUCache(2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get_many(["a", "b", "c"]) == ({"a": 1, "c": 3}, ["b"])
+
+    now = time.monotonic()
+    monkeypatch.setattr("caches.time.monotonic", lambda: now + 11)
+    assert cache.get("a", "missing") == "missing"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LRUCache(0)
+    cache.set("a", 1)
+    assert len(cache) == 0
+
+
+def test_user_update_drops_identity_and_username(app):
+    from auth.identity import identity_cache, load_identity
+    from usernames import resolve_user_id, resolve_usernames, username_cache
+
+    with app.app_context():
+        user = db.session.get(User, 2)
+        old_name = user.username
+        load_identity(user.id)
+        resolve_usernames([user.id])
+        assert identity_cache.get(user.id) is not None
+        assert username_cache.get_id(old_name) == user.id
+
+        user.username = f"{old_name}-renamed"
+        db.session.commit()
+        try:
+            assert identity_cache.get(user.id) is None
+            assert username_cache.get_id(old_name) is None
+            assert resolve_user_id(f"{old_name}-renamed") == user.id
+            assert load_identity(user.id)["username"] == f"{old_name}-renamed"
+        finally:
+            user.username = old_name
+            db.session.commit()
@@ -0,0 +1,83 @@
+# backend/tests/test_cross_process.py
+"""
+Pieces shared between worker processes: the SQLite socket bus and the SQLite
+rate-limit storage
+
+Each "worker" is a separate manager/storage instance with its own connection
+to the same file, which is all another process would have in common with it.
+"""
+import queue
+
+import pytest
+import socketio
+from limits import parse
+from limits.strategies import (
+    FixedWindowRateLimiter,
+    MovingWindowRateLimiter,
+    SlidingWindowCounterRateLimiter,
+)
+
+from auth.ratelimit_storage import SQLiteStorage
+from socket_bus import SQLiteBusManager
+
+
+def _start_listening(manager):
+    """
+    Start the manager's listener thread and return once it is subscribed
+
+    _listen() opens the connection and reads the last message id under
+    manager._lock, so once the connection exists and the lock is free again,
+    anything published afterwards will be delivered.
+    """
+    manager.initialize()
+    for _ in range(500):
+        if manager._conn is not None:
+            break
+        manager.server.sleep(0.01)
+    with manager._lock:
+        pass
+
+
+def test_emit_on_one_worker_reaches_another(tmp_path):
+    url = f"sqlite:///{tmp_path / 'socket_bus.db'}"
+    sender = SQLiteBusManager(url, write_only=True)
+    receiver = SQLiteBusManager(url, poll_interval=0.01)
+    sender_server = socketio.Server(client_manager=sender, async_mode="threading")
+    socketio.Server(client_manager=receiver, async_mode="threading")
+
+    # Published before the receiver subscribed: must not be replayed to it
+    sender_server.emit("new_message", {"id": 0}, room="user_5")
+
+    delivered = queue.Queue()
+    receiver._handle_emit = delivered.put
+    _start_listening(receiver)
+
+    sender_server.emit("new_message", {"id": 1, "text": "hello"}, room="user_5")
+
+    message = delivered.get(timeout=5)
+    assert message["event"] == "new_message"
+    assert message["room"] == "user_5"
+    assert message["data"] == [{"id": 1, "text": "hello"}]
+    assert message["host_id"] == sender.host_id
+    assert delivered.empty()
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    [FixedWindowRateLimiter, MovingWindowRateLimiter, SlidingWindowCounterRateLimiter],
+)
+def test_sqlite_limit_holds_across_workers(tmp_path, strategy):
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    first = strategy(SQLiteStorage(uri))
+    second = strategy(SQLiteStorage(uri))
+    limit = parse("3 per minute")
+
+    # Three hits split over both workers use up the limit for both of them
+    assert first.hit(limit, "login", "10.0.0.1")
+    assert second.hit(limit, "login", "10.0.0.1")
+    assert first.hit(limit, "login", "10.0.0.1")
+    assert not second.hit(limit, "login", "10.0.0.1")
+    assert not first.hit(limit, "login", "10.0.0.1")
+
+    # Other keys are counted separately
+    assert second.hit(limit, "login", "10.0.0.2")
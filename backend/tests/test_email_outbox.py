@@ -0,0 +1,110 @@
+# backend/tests/test_email_outbox.py
+"""
+Outbox delivery: lease, supersede on resend, retry with backoff, dead-lettering
+
+The worker runs synchronously (process_due) against FakeTransport, so
+nothing is sent anywhere and no background thread is involved.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import email_outbox
+from email_outbox import OutboxWorker, enqueue_verification_email
+from email_service import FakeTransport
+from models import db, EmailOutbox
+
+
+@pytest.fixture
+def transport():
+    return FakeTransport()
+
+
+@pytest.fixture
+def worker(app, transport):
+    with app.app_context():
+        EmailOutbox.query.delete()
+        db.session.commit()
+    return OutboxWorker(app, transport=transport)
+
+
+def _rows(app):
+    with app.app_context():
+        return [
+            (row.status, json.loads(row.payload)["code"], row.attempts)
+            for row in EmailOutbox.query.order_by(EmailOutbox.id)
+        ]
+
+
+def _queue(app, to_email, code):
+    with app.app_context():
+        row = enqueue_verification_email(to_email, code)
+        db.session.commit()
+        return row.id
+
+
+def _make_due(app):
+    # stand-in for waiting out the lease / backoff
+    with app.app_context():
+        EmailOutbox.query.update({EmailOutbox.next_attempt_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+
+def test_claimed_row_is_leased_to_one_worker(app, worker, transport):
+    row_id = _queue(app, "lease@nyu.edu", "1111")
+    other = OutboxWorker(app, transport=transport)
+    with app.app_context():
+        assert worker._claim(row_id) is not None
+        assert other._claim(row_id) is None
+    assert other.process_due() == 0
+
+
+def test_resend_supersedes_older_pending_code(app, client, worker, transport):
+    response = client.post("/auth/register", json={
+        "username": "outboxuser", "email": "outboxuser@nyu.edu", "password": "SecurePass123!",
+    })
+    assert response.status_code == 201
+    assert client.post("/auth/resend-code", json={"email": "outboxuser@nyu.edu"}).status_code == 200
+
+    (first_status, _, _), (second_status, new_code, _) = _rows(app)
+    assert (first_status, second_status) == ("superseded", "pending")
+
+    assert worker.process_due() == 1
+    assert len(transport.sent) == 1
+    assert new_code in json.dumps(transport.sent[0])
+
+
+def test_failed_send_is_retried_after_backoff(app, worker, transport):
+    _queue(app, "retry@nyu.edu", "2222")
+    transport.fail_next = 1
+
+    assert worker.process_due() == 1
+    assert _rows(app) == [("pending", "2222", 1)]
+    with app.app_context():
+        row = EmailOutbox.query.one()
+        assert row.last_error == "fake transport failure"
+        assert row.next_attempt_at > datetime.utcnow()
+    # not due again until the backoff has passed
+    assert worker.process_due() == 0
+
+    _make_due(app)
+    assert worker.process_due() == 1
+    assert _rows(app) == [("sent", "2222", 2)]
+    assert len(transport.sent) == 1
+
+
+def test_row_is_dead_lettered_after_max_attempts(app, worker, transport, monkeypatch):
+    monkeypatch.setattr(email_outbox, "MAX_ATTEMPTS", 3)
+    _queue(app, "dead@nyu.edu", "3333")
+    transport.fail_next = 10
+
+    for _ in range(3):
+        _make_due(app)
+        assert worker.process_due() == 1
+    assert _rows(app) == [("dead", "3333", 3)]
+    assert worker.dead == 1
+
+    _make_due(app)
+    assert worker.process_due() == 0
+    assert transport.sent == []
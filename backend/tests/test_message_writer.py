@@ -0,0 +1,99 @@
+# backend/tests/test_message_writer.py
+"""
+Group commits of chat messages: batching, emit-after-commit, bounded queue
+
+The writer runs against a stand-in for the Socket.IO server: a stdlib queue,
+a plain thread for the background task, and an emit() that records what was
+sent and whether the message was already committed at that moment.
+"""
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+
+from message_writer import MessageWriter, MessageWriterBusy
+from models import db, Message
+
+
+class FakeSocketIO:
+    def __init__(self, app, run_tasks=True):
+        self.app = app
+        self.run_tasks = run_tasks
+        self.server = SimpleNamespace(eio=SimpleNamespace(create_queue=queue.Queue))
+        self.emitted = []
+        self.all_emitted = threading.Event()
+        self.expected = 0
+
+    def start_background_task(self, target, *args):
+        if self.run_tasks:
+            threading.Thread(target=target, args=args, daemon=True).start()
+
+    def emit(self, event, data, room=None):
+        # Look the row up on a separate connection: only committed rows are visible
+        with self.app.app_context(), db.engines["messages"].connect() as conn:
+            committed = conn.execute(
+                select(Message.id).where(Message.id == data["id"])
+            ).first() is not None
+        self.emitted.append((event, data["body"], room, committed))
+        if len(self.emitted) >= self.expected:
+            self.all_emitted.set()
+
+
+def test_messages_arriving_together_share_one_commit(app):
+    socketio = FakeSocketIO(app)
+    writer = MessageWriter(socketio, app, max_batch=100, max_delay=0.2)
+    socketio.expected = 10  # five messages, each to the recipient's and the sender's room
+
+    for n in range(5):
+        writer.submit(1, 2, f"batched {n}", client_id=f"c{n}")
+
+    assert socketio.all_emitted.wait(timeout=5)
+    assert writer.batches == 1
+    assert writer.stats()["max_batch_size"] == 5
+    assert {room for _, _, room, _ in socketio.emitted} == {"user_1", "user_2"}
+    assert all(event == "new_message" and committed for event, _, _, committed in socketio.emitted)
+
+
+def test_full_queue_rejects_instead_of_growing(app):
+    # No background task: nothing drains the queue
+    writer = MessageWriter(FakeSocketIO(app, run_tasks=False), app, max_queued=2)
+    writer.submit(1, 2, "one")
+    writer.submit(1, 2, "two")
+
+    with pytest.raises(MessageWriterBusy):
+        writer.submit(1, 2, "three")
+    assert writer.stats()["queued"] == 2
+    assert writer.stats()["rejected"] == 1
+
+
+def test_sender_is_told_when_the_writer_is_busy(app, client, monkeypatch):
+    import app as app_module
+
+    def busy(*args, **kwargs):
+        raise MessageWriterBusy("message queue is full")
+    monkeypatch.setattr(app_module.message_writer, "submit", busy)
+
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    socket = app_module.socketio.test_client(app, flask_test_client=client)
+
+    # Record emits at the SocketIO object, like benchmarks/suite.py does
+    emitted = []
+    original_emit = app_module.socketio.emit
+
+    def record(event, *args, **kwargs):
+        emitted.append((event, args[0] if args else None, kwargs.get("to")))
+        return original_emit(event, *args, **kwargs)
+    monkeypatch.setattr(app_module.socketio, "emit", record)
+
+    socket.emit("send_message", {"recipient_id": 2, "body": "hello", "client_id": "c1"})
+    socket.disconnect()
+
+    errors = [(data, to) for event, data, to in emitted if event == "message_error"]
+    assert len(errors) == 1
+    data, to = errors[0]
+    assert data["body"] == "hello" and data["client_id"] == "c1"
+    assert to is not None  # only to the sending client
+    assert not any(event == "new_message" for event, _, _ in emitted)
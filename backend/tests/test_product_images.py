@@ -0,0 +1,40 @@
+# backend/tests/test_product_images.py
+"""
+Variant rendering: files appear complete or not at all
+"""
+import os
+import stat
+
+import pytest
+
+from products import images
+from products.storage import BLOB_FILE_MODE
+
+pytestmark = pytest.mark.skipif(images.Image is None, reason="Pillow not installed")
+
+
+def test_render_variant_replaces_destination_atomically(tmp_path):
+    destination = tmp_path / "photo_thumb.webp"
+    images.render_variant(images.Image.new("RGB", (800, 600)), 200, str(destination))
+
+    assert os.listdir(tmp_path) == ["photo_thumb.webp"]
+    assert stat.S_IMODE(os.stat(destination).st_mode) == BLOB_FILE_MODE
+    with images.Image.open(destination) as variant:
+        assert max(variant.size) == 200
+
+
+def test_failed_render_leaves_previous_file_and_no_temp(tmp_path, monkeypatch):
+    destination = tmp_path / "photo_thumb.webp"
+    destination.write_bytes(b"previous")
+    source = images.Image.new("RGB", (800, 600))
+
+    def fail(self, fp, *args, **kwargs):
+        fp.write(b"partial")
+        raise OSError("disk full")
+    monkeypatch.setattr(images.Image.Image, "save", fail)
+
+    with pytest.raises(OSError):
+        images.render_variant(source, 200, str(destination))
+
+    assert os.listdir(tmp_path) == ["photo_thumb.webp"]
+    assert destination.read_bytes() == b"previous"
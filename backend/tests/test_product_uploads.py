@@ -0,0 +1,79 @@
+# backend/tests/test_product_uploads.py
+"""
+Image uploads: signature check on short files, when and how blobs are stored
+
+The upload folder is pointed at a temporary directory so nothing is written
+into static/uploads.
+"""
+import io
+import os
+import stat
+
+import pytest
+
+from models import db, Product
+from products import storage
+
+JPEG_BYTES = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00' + b'\x00' * 64
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "upload_dir", lambda app: str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def seller(client):
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    return client
+
+
+def _create(client, image_bytes):
+    return client.post("/products", data={
+        "title": "Camera", "price": "10", "category": "electronics", "condition": "good",
+        "image": (io.BytesIO(image_bytes), "camera.jpg"),
+    }, content_type="multipart/form-data")
+
+
+def test_upload_shorter_than_signature_window_is_rejected(app, seller, uploads):
+    with app.app_context():
+        before = db.session.query(Product).count()
+
+    # A bare JPEG marker matches the sniffed prefix but is not an image
+    response = _create(seller, JPEG_BYTES[:3])
+
+    assert response.status_code == 415
+    assert os.listdir(uploads) == []
+    with app.app_context():
+        assert db.session.query(Product).count() == before
+
+
+def _adopt(app, uploads, content_hash, finish):
+    """Hand a temp file to storage, then commit or roll back; returns (temp path, stored path)"""
+    temp_path = uploads / f".upload-{content_hash[:8]}"
+    temp_path.write_bytes(JPEG_BYTES)
+    os.chmod(temp_path, 0o600)
+    with app.app_context():
+        blob = storage.adopt_temp_file(str(uploads), str(temp_path), content_hash, len(JPEG_BYTES), "jpg")
+        relative_path = blob.path
+        # Nothing is moved before the transaction ends
+        assert not (uploads / relative_path).exists()
+        finish()
+    return temp_path, uploads / relative_path
+
+
+def test_upload_is_stored_world_readable_on_commit(app, uploads):
+    temp_path, stored = _adopt(app, uploads, "ab" * 32, db.session.commit)
+
+    assert not temp_path.exists()
+    assert stat.S_IMODE(os.stat(stored).st_mode) == storage.BLOB_FILE_MODE
+
+
+@pytest.mark.parametrize("finish", ["rollback", "close"])
+def test_upload_is_discarded_when_transaction_does_not_commit(app, uploads, finish):
+    temp_path, stored = _adopt(app, uploads, "cd" * 32, getattr(db.session, finish))
+
+    assert not temp_path.exists()
+    assert not stored.exists()
@@ -0,0 +1,16 @@
+# backend/tests/test_products_pagination.py
+"""
+Out-of-range page sizes are clamped to 1..100 in both pagination modes
+"""
+import pytest
+
+
+@pytest.mark.parametrize("url", ["/products", "/products/user/1"])
+@pytest.mark.parametrize("mode", ["", "&cursor="])
+@pytest.mark.parametrize("page_size, expected", [(0, 1), (-5, 1), (1000, 100)])
+def test_page_size_is_clamped(client, url, mode, page_size, expected):
+    response = client.get(f"{url}?page_size={page_size}{mode}")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["page_size"] == expected
+    assert len(body["items"]) <= expected
@@ -0,0 +1,44 @@
+# backend/tests/test_products_queries.py
+"""
+Product list pages must cost a fixed number of queries, whatever their size
+
+Sellers and images are eager-loaded for the whole page (with_list_relations
+in products/products.py); serializing them lazily would add two queries per
+product.
+"""
+from sqlalchemy import func
+
+from models import Product
+
+
+def _busiest_seller(app):
+    from models import db
+    with app.app_context():
+        return (
+            db.session.query(Product.user_id)
+            .filter_by(is_public=True, status='active')
+            .group_by(Product.user_id)
+            .order_by(func.count().desc())
+            .limit(1)
+            .scalar()
+        )
+
+
+def _page(client, count_queries, url, page_size):
+    response, queries = count_queries(lambda: client.get(f"{url}?page_size={page_size}"))
+    assert response.status_code == 200
+    assert len(response.get_json()["items"]) == page_size
+    return queries
+
+
+def test_product_list_queries_do_not_grow_with_page_size(client, count_queries):
+    small = _page(client, count_queries, "/products", 5)
+    large = _page(client, count_queries, "/products", 50)
+    assert small == large
+
+
+def test_user_products_queries_do_not_grow_with_page_size(app, client, count_queries):
+    url = f"/products/user/{_busiest_seller(app)}"
+    small = _page(client, count_queries, url, 5)
+    large = _page(client, count_queries, url, 50)
+    assert small == large
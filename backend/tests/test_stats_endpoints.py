@@ -0,0 +1,35 @@
+# backend/tests/test_stats_endpoints.py
+"""
+Monitoring endpoints answer only requests carrying STATS_TOKEN
+"""
+import pytest
+
+STATS_URLS = ["/products/cache/stats", "/api/messages/writer/stats", "/auth/pending-sweeper/stats"]
+
+
+@pytest.fixture
+def stats_token(monkeypatch):
+    monkeypatch.setenv("STATS_TOKEN", "s3cret")
+    return "s3cret"
+
+
+@pytest.mark.parametrize("url", STATS_URLS)
+def test_stats_need_the_token(client, stats_token, url):
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers={"Authorization": "Bearer wrong"}).status_code == 403
+
+    response = client.get(url, headers={"Authorization": f"Bearer {stats_token}"})
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("url", STATS_URLS)
+def test_stats_are_closed_without_a_configured_token(client, monkeypatch, url):
+    monkeypatch.delenv("STATS_TOKEN", raising=False)
+    assert client.get(url, headers={"Authorization": "Bearer "}).status_code == 403
+
+
+@pytest.mark.parametrize("url", STATS_URLS)
+def test_logged_in_users_are_not_enough(client, url):
+    with client.session_transaction() as session:
+        session["user_id"] = 1
+    assert client.get(url).status_code == 401
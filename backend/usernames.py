@@ -0,0 +1,106 @@
+# backend/usernames.py
+"""
+Batched user id <-> username resolution for message payloads
+
+Message payloads carry sender_username / recipient_username so clients can
+tell their own messages apart. Looking those up one User at a time costs two
+queries per message; on a socket connect with 50 messages of history that is
+100 point queries, and a burst of reconnects multiplies it.
+
+resolve_usernames() answers a whole payload at once: ids already in the
+process-wide identity cache are served from memory and the rest are fetched
+with a single `WHERE id IN (...)` query. Usernames are effectively immutable,
+but the cache still drops an entry whenever its User row is updated or
+deleted (see caches.on_user_changed).
+"""
+from caches import LRUCache, on_user_changed
+from models import db, User
+
+# Number of users whose usernames are kept in memory per process
+USERNAME_CACHE_SIZE = 10000
+
+
+class UsernameCache(LRUCache):
+    """LRU map of user id -> username that can also look ids up by username"""
+
+    def __init__(self, max_entries=USERNAME_CACHE_SIZE):
+        super().__init__(max_entries)
+        self._ids = {}
+
+    def get_id(self, username):
+        with self._lock:
+            return self._ids.get(username)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids.clear()
+
+    def _stored(self, user_id, username):
+        self._ids[username] = user_id
+
+    def _removed(self, user_id, username):
+        self._ids.pop(username, None)
+
+
+username_cache = UsernameCache()
+
+
+def resolve_usernames(user_ids):
+    """
+    Map user ids to usernames with at most one query
+
+    Unknown ids are simply missing from the result.
+    """
+    wanted = {int(user_id) for user_id in user_ids if user_id is not None}
+    found, missing = username_cache.get_many(wanted)
+    if missing:
+        rows = db.session.query(User.id, User.username).filter(User.id.in_(missing)).all()
+        for user_id, username in rows:
+            username_cache.set(user_id, username)
+            found[user_id] = username
+    return found
+
+
+def resolve_user_id(val):
+    """
+    Accept an int-like value or a username and return the numeric id or None
+
+    Username lookups go through the same cache, so the socket handlers don't
+    query the user table for every message sent.
+    """
+    if val is None:
+        return None
+    try:
+        return int(val)
+    except (ValueError, TypeError):
+        pass
+    user_id = username_cache.get_id(val)
+    if user_id is not None:
+        return user_id
+    row = db.session.query(User.id).filter_by(username=val).first()
+    if row is None:
+        return None
+    username_cache.set(row.id, val)
+    return row.id
+
+
+def message_payloads(messages, fields=('sender', 'recipient')):
+    """
+    Serialize messages with <field>_username added, resolving all users at once
+
+    `fields` picks which of sender / recipient get a username.
+    """
+    names = resolve_usernames(
+        getattr(m, f"{field}_id") for m in messages for field in fields
+    )
+    payloads = []
+    for m in messages:
+        d = m.to_dict()
+        for field in fields:
+            d[f"{field}_username"] = names.get(getattr(m, f"{field}_id"))
+        payloads.append(d)
+    return payloads
+
+
+on_user_changed(username_cache.forget)
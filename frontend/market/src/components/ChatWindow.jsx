@@ -4,6 +4,8 @@ import { io } from "socket.io-client";
 import { IoSend } from "react-icons/io5";
 
 const SOCKET_URL = "http://localhost:5001";
+// acknowledge received messages at most this often (plus on leave)
+const ACK_INTERVAL_MS = 5000;
 
 function isNumericString(s) {
   return typeof s === "string" && /^\d+$/.test(s);
@@ -19,6 +21,54 @@ export default function ChatWindow() {
   const [meName, setMeName] = useState(null); // username from /auth/me (if available)
   const socketRef = useRef(null);
   const messagesEndRef = useRef(null);
+  // newest message id this client has received; sent on (re)connect so the
+  // server only replays what was missed
+  const lastSeenIdRef = useRef(null);
+  // newest id already acknowledged, and the pending ack timer
+  const ackedIdRef = useRef(null);
+  const ackTimerRef = useRef(null);
+  // socket handlers are registered once; read the current peer through a ref
+  const otherRef = useRef(other);
+  otherRef.current = other;
+
+  // send the newest received id, if it wasn't acknowledged yet
+  function flushAck() {
+    clearTimeout(ackTimerRef.current);
+    ackTimerRef.current = null;
+    const newest = lastSeenIdRef.current;
+    if (newest == null || (ackedIdRef.current != null && newest <= ackedIdRef.current)) return;
+    ackedIdRef.current = newest;
+    socketRef.current?.emit("ack", { up_to_id: newest });
+  }
+
+  // remember the newest id; the ack goes out at most every ACK_INTERVAL_MS
+  // (every ack is a database write on the server)
+  function markSeen(list) {
+    const ids = list.map((m) => m.id).filter((id) => typeof id === "number");
+    if (!ids.length) return;
+    const newest = Math.max(...ids);
+    if (lastSeenIdRef.current != null && newest <= lastSeenIdRef.current) return;
+    lastSeenIdRef.current = newest;
+    if (ackTimerRef.current == null) {
+      ackTimerRef.current = setTimeout(flushAck, ACK_INTERVAL_MS);
+    }
+  }
+
+  // the socket delivers messages from every conversation; keep this thread's
+  function inThread(m) {
+    const peer = String(otherRef.current);
+    if (isNumericString(peer)) {
+      return String(m.sender_id) === peer || String(m.recipient_id) === peer;
+    }
+    return m.sender_username === peer || m.recipient_username === peer;
+  }
+
+  // merge messages into the list, skipping ids we already have
+  function mergeMessages(prev, incoming) {
+    const known = new Set(prev.map((m) => m.id));
+    const fresh = incoming.filter((m) => !known.has(m.id));
+    return fresh.length ? [...prev, ...fresh] : prev;
+  }
 
   // Fetch authoritative "me" info (id + username) from backend
   useEffect(() => {
@@ -73,7 +123,12 @@ export default function ChatWindow() {
   // Setup socket once
   useEffect(() => {
     setError(null);
-    socketRef.current = io(SOCKET_URL, { withCredentials: true, transports: ["websocket", "polling"] });
+    socketRef.current = io(SOCKET_URL, {
+      withCredentials: true,
+      transports: ["websocket", "polling"],
+      // evaluated on every (re)connect
+      auth: (cb) => cb(lastSeenIdRef.current != null ? { last_seen_id: lastSeenIdRef.current } : {}),
+    });
     const socket = socketRef.current;
 
     socket.on("connect", () => {
@@ -86,6 +141,8 @@ export default function ChatWindow() {
 
     socket.on("disconnect", (reason) => {
       console.warn("socket disconnected", reason);
+      // buffered by socket.io and sent once reconnected
+      flushAck();
       setSocketStatus("disconnected");
     });
 
@@ -97,11 +154,29 @@ export default function ChatWindow() {
 
     socket.on("message_history", (data) => {
       if (data && Array.isArray(data.messages)) {
-        setMessages(data.messages);
+        const thread = data.messages.filter(inThread);
+        setMessages((prev) => mergeMessages(prev, thread));
+        markSeen(data.messages);
         scrollToBottom();
       }
     });
 
+    // only the messages missed while disconnected, oldest first, in pages
+    socket.on("missed_messages", (data) => {
+      if (!data || !Array.isArray(data.messages)) return;
+      if (data.messages.length) {
+        const thread = data.messages.filter(inThread);
+        if (thread.length) {
+          setMessages((prev) => mergeMessages(prev, thread));
+          scrollToBottom();
+        }
+        markSeen(data.messages);
+      }
+      if (data.has_more) {
+        socket.emit("sync", { after_id: data.after_id });
+      }
+    });
+
     socket.on("new_message", (msg) => {
       // DEBUG: show incoming message and local identity info
       console.log("DEBUG new_message received:", {
@@ -111,6 +186,8 @@ export default function ChatWindow() {
         meName
       });
 
+      markSeen([msg]);
+      if (!inThread(msg)) return;
       setMessages((prev) => {
         if (prev.length && prev[prev.length - 1]?.id === msg.id) return prev;
         return [...prev, msg];
@@ -118,7 +195,18 @@ export default function ChatWindow() {
       scrollToBottom();
     });
 
+    // server turned the message away (writer backed up): put the text back to retry
+    socket.on("message_error", (data) => {
+      setError("Message not sent: " + (data?.error || "unknown error"));
+      if (data?.body) setText((prev) => prev || data.body);
+    });
+
+    // leaving the page: acknowledge what was received before the socket goes
+    window.addEventListener("pagehide", flushAck);
+
     return () => {
+      window.removeEventListener("pagehide", flushAck);
+      flushAck();
       try { socket.disconnect(); } catch (e) {}
       setSocketStatus("disconnected");
     };
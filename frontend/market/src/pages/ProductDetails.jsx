@@ -272,31 +272,17 @@ const ProductDetails = () => {
       setMessagesError(null);
       setMessagesList([]);
 
-      const target = encodeURIComponent(sellerId ?? sellerUsername ?? "");
-      const attemptUrls = [
-        `http://localhost:5001/api/messages/inbox?recipient=${target}`,
-      ];
-
+      // One entry per conversation (latest message + unread count), read from
+      // the maintained summaries instead of every message ever received
       let got = null;
-      for (const url of attemptUrls) {
-        try {
-          const r = await fetch(url, { credentials: "include" });
-          if (!r.ok) continue;
+      try {
+        const r = await fetch("http://localhost:5001/api/messages/conversations", { credentials: "include" });
+        if (r.ok) {
           const d = await r.json();
-          if (Array.isArray(d)) {
-            got = d;
-          } else if (Array.isArray(d.messages)) {
-            got = d.messages;
-          } else if (Array.isArray(d.data)) {
-            got = d.data;
-          } else {
-            const nested = d.messages?.data;
-            if (Array.isArray(nested)) got = nested;
-          }
-          if (got) break;
-        } catch (e) {
-          // try next url
+          if (Array.isArray(d.conversations)) got = d.conversations;
         }
+      } catch (e) {
+        // handled below
       }
 
       if (!got) {
@@ -306,13 +292,15 @@ const ProductDetails = () => {
         return;
       }
 
-      const normalized = got.map((m) => ({
-        id: m.id ?? m.message_id ?? m._id ?? null,
-        text: m.text ?? m.body ?? m.message ?? "",
-        sender_username: m.sender_username ?? m.from_username ?? m.sender ?? null,
-        sender_id: m.sender_id ?? m.from_id ?? m.from ?? null,
-        timestamp: m.created_at ?? m.timestamp ?? m.ts ?? m.created ?? null,
-        raw: m,
+      const normalized = got.map((c) => ({
+        id: c.last_message?.id ?? null,
+        text: c.last_message?.body ?? "",
+        // the other side of the conversation - who "Reply" opens a chat with
+        sender_username: c.peer_username ?? null,
+        sender_id: c.peer_id ?? null,
+        timestamp: c.last_activity_at ?? null,
+        unread: c.unread_count ?? 0,
+        raw: c,
       }));
 
       setMessagesList(normalized);
@@ -538,6 +526,9 @@ const ProductDetails = () => {
                               </span>
                             </div>
                             <div className="text-sm text-gray-400 mt-1">{m.text}</div>
+                            {m.unread > 0 && (
+                              <div className="text-xs text-[#E0B0FF] mt-1">{m.unread} unread</div>
+                            )}
                             {m.timestamp && (
                               <div className="text-xs text-gray-500 mt-2">
                                 {isNaN(new Date(m.timestamp).getTime())